@@ -4,24 +4,32 @@ from __future__ import division
 from flask import Flask
 from flask import abort, request, g
 from flask import make_response, current_app, send_file, url_for
-from flask import jsonify, redirect
+from flask import jsonify, redirect, copy_current_request_context
 from flask.ext.sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError
 from raven.contrib.flask import Sentry
 from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import FileWrapper
 from functools import update_wrapper
 from itertools import groupby
 import simplejson as json
 from collections import OrderedDict
 import decimal
-import operator
+import gzip
+import hashlib
 import math
 from math import log10, log
 from datetime import timedelta
 import re
 import os
+import shelve
 import shutil
 import tempfile
+import threading
+import time
 import zipfile
+from cStringIO import StringIO
 import pylibmc
 import mockcache
 from boto.s3.connection import S3Connection
@@ -30,11 +38,92 @@ from boto.exception import S3ResponseError
 from validation import qwarg_validate, NonemptyString, FloatRange, StringList, Bool, OneOf, Integer, ClientRequestValidationException
 
 from census_extractomatic.exporters import create_ogr_download, create_excel_download, supported_formats
+from census_extractomatic import rpn
+from census_extractomatic.rpn import compile_rpn
+from census_extractomatic.geoid_index import GeoidReleaseIndex
+from census_extractomatic.geoid_filter import geoid_filter, pg_array
+from census_extractomatic.availability import AvailabilityMatrix, NONE as NOT_AVAILABLE
+from census_extractomatic.lru import LRUCache
+from census_extractomatic.s3_writer import S3WriteBehind
+from census_extractomatic.singleflight import SingleFlight
+from census_extractomatic.metrics import CacheMetrics
+from census_extractomatic.cache_backends import DiskCache, S3Cache
+from census_extractomatic.prepared import PreparedStatements
+from census_extractomatic.replicas import ReplicaPool
+from census_extractomatic.timing import RequestTimings, current_timings, timed, track_queries
 
 app = Flask(__name__)
 app.config.from_object(os.environ.get('EXTRACTOMATIC_CONFIG_MODULE', 'census_extractomatic.config.Development'))
 db = SQLAlchemy(app)
 sentry = Sentry(app)
+track_queries()
+
+# Replica engines are pooled the same way as the primary's
+replica_engine_options = {'convert_unicode': True}
+db.apply_pool_defaults(app, replica_engine_options)
+
+# Every endpoint only reads, so requests go to a replica when there's a
+# healthy one and to SQLALCHEMY_DATABASE_URI when there isn't
+replicas = ReplicaPool('read', app.config.get('SQLALCHEMY_REPLICA_URIS', []),
+    max_lag=app.config.get('REPLICA_MAX_LAG', 60),
+    check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 10),
+    engine_options=replica_engine_options)
+# Long-running downloads and spatial queries get their own replicas, so
+# they can't tie up the ones serving everything else
+heavy_replicas = ReplicaPool('heavy', app.config.get('SQLALCHEMY_HEAVY_REPLICA_URIS', []),
+    max_lag=app.config.get('REPLICA_MAX_LAG', 60),
+    check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 10),
+    engine_options=replica_engine_options)
+HEAVY_ENDPOINTS = set(['geo_tiles', 'show_specified_geo_data', 'download_specified_data'])
+
+# The hottest queries, prepared once per pooled connection and release schema
+statements = PreparedStatements()
+statements.register('geoheader',
+    """SELECT geoid,sumlevel,name FROM {schema}.geoheader WHERE geoid=$1""")
+statements.register('name_lookup',
+    """SELECT DISTINCT full_geoid,sumlevel,display_name,simple_name,aland
+       FROM {schema}.census_name_lookup
+       WHERE full_geoid = ANY(CAST($1 AS varchar[]))""")
+statements.register('geo_lookup',
+    """SELECT display_name,simple_name,sumlevel,full_geoid,population,aland,awater
+       FROM {schema}.census_name_lookup
+       WHERE full_geoid=$1
+       LIMIT 1""")
+statements.register('geo_lookup_geom',
+    """SELECT display_name,simple_name,sumlevel,full_geoid,population,aland,awater,
+       ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,ST_Perimeter(geom) / 1700)) as geom
+       FROM {schema}.census_name_lookup
+       WHERE full_geoid=$1
+       LIMIT 1""")
+statements.register('tile_features',
+    """SELECT
+        ST_AsGeoJSON(ST_SimplifyPreserveTopology(
+            ST_Intersection(ST_Buffer(ST_MakeEnvelope($1, $2, $3, $4, 4326), 0.09, 'endcap=square'), geom),
+            ST_Perimeter(geom) / 2500), 6) as geom,
+        full_geoid,
+        display_name
+       FROM {schema}.census_name_lookup
+       WHERE sumlevel=$5 AND ST_Intersects(ST_MakeEnvelope($1, $2, $3, $4, 4326), geom)""")
+statements.register('table_metadata',
+    """SELECT table_id,table_title,simple_table_title,subject_area,universe,denominator_column_id,topics
+       FROM {schema}.census_table_metadata
+       WHERE table_id=$1""")
+statements.register('column_metadata',
+    """SELECT column_id,column_title,indent,parent_column_id
+       FROM {schema}.census_column_metadata
+       WHERE table_id=$1""")
+statements.register('table_columns',
+    """SELECT tab.table_id,
+              tab.table_title,
+              tab.universe,
+              tab.denominator_column_id,
+              col.column_id,
+              col.column_title,
+              col.indent
+       FROM {schema}.census_column_metadata col
+       LEFT JOIN {schema}.census_table_metadata tab USING (table_id)
+       WHERE table_id = ANY(CAST($1 AS varchar[]))
+       ORDER BY column_id""")
 
 if not app.debug:
     import logging
@@ -68,6 +157,9 @@ allowed_tiger = [
     'tiger2014',
     'tiger2013',
 ]
+# Profiles take their geography names and containment from this TIGER
+# release, so their cache keys include it (and its cache generation).
+profile_tiger_release = 'tiger2014'
 
 allowed_searches = [
     'table',
@@ -186,34 +278,469 @@ state_fips = {
     "78": "United States Virgin Islands"
 }
 
+# Uploads to S3 happen in the background; see put_in_cache
+s3_writer = S3WriteBehind(
+    workers=app.config.get('S3_WRITE_WORKERS', 2),
+    max_queue=app.config.get('S3_WRITE_QUEUE_SIZE', 1000)
+)
+
+
+def get_s3_bucket():
+    "The cache bucket, looked up once and reused, or None if S3 isn't configured."
+    if current_app.s3 is None:
+        return None
+
+    bucket = getattr(current_app, 's3_bucket', None)
+    if bucket is None or bucket.connection is not current_app.s3:
+        bucket = current_app.s3.get_bucket('embed.censusreporter.org', validate=False)
+        current_app.s3_bucket = bucket
+    return bucket
+
+
+# Cache tiers after memcache, fastest first
+cache_backends = []
+if app.config.get('DISK_CACHE_DIR'):
+    cache_backends.append(DiskCache(app.config['DISK_CACHE_DIR'],
+        app.config.get('DISK_CACHE_BYTES', 20 * 1024 ** 3),
+        scan_interval=app.config.get('DISK_CACHE_SCAN_INTERVAL', 300)))
+cache_backends.append(S3Cache(get_s3_bucket, s3_writer))
+
+
+# The first and fastest cache tier: recently used values kept in this worker,
+# in front of memcache, in front of S3.
+local_cache = LRUCache(
+    maxbytes=app.config.get('LOCAL_CACHE_BYTES', 64 * 1024 * 1024),
+    ttl=app.config.get('LOCAL_CACHE_TTL', 300)
+)
+
+
+def is_gzipped(value):
+    return isinstance(value, str) and value[:2] == '\x1f\x8b'
+
+
+def compress_value(value):
+    "Gzip a value for the cache. Already compressed values are left alone."
+    if is_gzipped(value):
+        return value
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+
+    buf = StringIO()
+    # A fixed mtime keeps the compressed bytes the same for the same value
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6, mtime=0) as f:
+        f.write(value)
+    return buf.getvalue()
+
+
+def decompress_value(value):
+    "The plain value for something from the cache, compressed or not."
+    if not is_gzipped(value):
+        return value
+    return gzip.GzipFile(fileobj=StringIO(value)).read()
+
+
+def accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+
+def make_cached_response(value, etag=None):
+    """A response for a value from the cache. Compressed values go out as
+    they are to clients that accept gzip, and decompressed to the rest.
+    With an `etag`, a client that already has the value gets a 304."""
+    gzipped = is_gzipped(value) and accepts_gzip()
+    if gzipped:
+        resp = make_response(value)
+        resp.headers.set('Content-Encoding', 'gzip')
+    else:
+        resp = make_response(decompress_value(value))
+
+    if is_gzipped(value):
+        resp.headers.set('Vary', 'Accept-Encoding')
+    if etag:
+        # Each encoding is a different representation, so gets its own ETag
+        resp.set_etag(etag + '-gzip' if gzipped else etag)
+        resp.make_conditional(request)
+    return resp
+
+
+def fresh_key(cache_key):
+    return cache_key + '.fresh'
+
+
+def etag_key(cache_key):
+    return cache_key + '.etag'
+
+
 def get_from_cache(cache_key, try_s3=True):
-    # Try memcache first
-    cached = g.cache.get(cache_key)
-
-    if not cached and try_s3 and current_app.s3 is not None:
-        # Try S3 next
-        b = current_app.s3.get_bucket('embed.censusreporter.org', validate=False)
-        k = Key(b)
-        k.key = cache_key
+    """Look for `cache_key` in each cache tier in turn, copying a hit into
+    the faster tiers in front of the one it was found in.
+
+    Values come back as they're stored, which is usually gzipped; see
+    decompress_value and make_cached_response."""
+    return lookup_cache(cache_key, try_s3)[0]
+
+
+def lookup_cache(cache_key, try_s3=True):
+    """Like get_from_cache, but returns `(value, fresh, etag)`.
+
+    A value stops being fresh CACHE_SOFT_TTL seconds after it was rendered,
+    which memcache tracks with a '.fresh' marker that expires then, and the
+    tiers in cache_backends with when the value was written. Stale values are still returned;
+    they're gone only once a tier's own (hard) expiry removes them.
+
+    The ETag stored next to the value comes back from the local tier or in
+    the same memcache round trip as the value, or is None if it isn't there.
+
+    Every tier checked is recorded in cache_metrics, and the outcome is
+    sent back in the X-Cache header.
+    """
+    soft_ttl = current_app.config.get('CACHE_SOFT_TTL', 0)
+
+    start = time.time()
+    cached = local_cache.get(cache_key)
+    record_cache_op('local', 'hit' if cached else 'miss', cached, start)
+    if cached:
+        # Only fresh values are copied into the local tier
+        g.cache_status = 'HIT-local'
+        return (cached, True, local_cache.get(etag_key(cache_key)))
+
+    # Try memcache next
+    start = time.time()
+    keys = [cache_key, etag_key(cache_key)]
+    if soft_ttl:
+        keys.append(fresh_key(cache_key))
+    found = g.cache.get_multi(keys)
+    cached = found.get(cache_key)
+    fresh = not soft_ttl or fresh_key(cache_key) in found
+    etag = found.get(etag_key(cache_key))
+    record_cache_op('memcache', ('hit' if fresh else 'stale') if cached else 'miss', cached, start)
+
+    if cached:
+        g.cache_status = '%s-memcache' % ('HIT' if fresh else 'STALE')
+        if fresh:
+            local_cache.set(cache_key, cached)
+            if etag:
+                local_cache.set(etag_key(cache_key), etag)
+        return (cached, fresh, etag)
+
+    for (i, backend) in enumerate(cache_backends):
+        if (backend.remote and not try_s3) or not backend.enabled():
+            continue
+
+        start = time.time()
+        (cached, age) = backend.get(cache_key)
+        if not cached:
+            record_cache_op(backend.name, 'miss', None, start)
+            continue
+
+        fresh = not soft_ttl or age is None or age < soft_ttl
+        record_cache_op(backend.name, 'hit' if fresh else 'stale', cached, start)
+        g.cache_status = '%s-%s' % ('HIT' if fresh else 'STALE', backend.name)
+
+        # Copy it into the faster tiers
         try:
-            cached = k.get_contents_as_string()
-        except S3ResponseError:
-            cached = None
+            g.cache.set(cache_key, cached, time=current_app.config.get('MEMCACHE_TTL', 0))
+            if soft_ttl and fresh:
+                g.cache.set(fresh_key(cache_key), 1, time=int(soft_ttl - (age or 0)) or 1)
+        except Exception as e:
+            app.logger.warn('Skipping memcache set for {} because {}'.format(cache_key, e.message))
+
+        if fresh:
+            local_cache.set(cache_key, cached)
+        for faster in cache_backends[:i]:
+            try:
+                # Passing its age along keeps a stale value stale
+                faster.set(cache_key, cached, age=age)
+            except Exception as e:
+                app.logger.warn('Skipping {} set for {} because {}'.format(faster.name, cache_key, e))
+
+        # Values that skip memcache (tiles) still have their ETags there
+        return (cached, fresh, etag)
+
+    g.cache_status = 'MISS'
+    return (None, False, None)
 
-        # TODO Should stick the S3 thing back in memcache
 
-    return cached
+def put_in_cache(cache_key, value, memcache=True, try_s3=True, content_type='application/json', write_behind=True, etag=None):
+    """Store `value`, gzipped, in each cache tier and return the compressed
+    bytes. The S3 upload is queued for a background thread unless
+    `write_behind` is False, and is dropped if too many are already waiting.
+    Only S3 is skipped when `try_s3` is False.
 
+    An `etag` (see make_etag) is kept in the local tier and memcache next to
+    the value, even if the value itself skips memcache."""
+    value = compress_value(value)
+    local_cache.set(cache_key, value)
+    if etag:
+        put_etag(cache_key, etag)
 
-def put_in_cache(cache_key, value, memcache=True, try_s3=True, content_type='application/json', ):
     if memcache:
-        g.cache.set(cache_key, value)
+        start = time.time()
+        g.cache.set(cache_key, value, time=current_app.config.get('MEMCACHE_TTL', 0))
+        record_cache_op('memcache', 'set', value, start)
+
+    soft_ttl = current_app.config.get('CACHE_SOFT_TTL', 0)
+    if soft_ttl:
+        g.cache.set(fresh_key(cache_key), 1, time=soft_ttl)
+
+    for backend in cache_backends:
+        if (backend.remote and not try_s3) or not backend.enabled():
+            continue
+
+        start = time.time()
+        try:
+            outcome = backend.set(cache_key, value, content_type, write_behind)
+        except Exception as e:
+            app.logger.warn('Skipping {} set for {} because {}'.format(backend.name, cache_key, e))
+            outcome = 'failed'
+        record_cache_op(backend.name, outcome, value, start)
+
+    return value
+
+
+# Cache operations by endpoint, tier and outcome; see /healthcheck/cache
+cache_metrics = CacheMetrics()
+
+
+def record_cache_op(tier, outcome, value, start):
+    endpoint = request.url_rule.rule if request.url_rule else request.path
+    seconds = time.time() - start
+    cache_metrics.record(endpoint, tier, outcome, len(value) if value else 0, seconds)
+    timings = current_timings()
+    if timings is not None:
+        timings.add('cache', seconds)
+
+
+@app.after_request
+def add_cache_status(resp):
+    cache_status = getattr(g, 'cache_status', None)
+    if cache_status:
+        resp.headers.set('X-Cache', cache_status)
+    return resp
+
+
+@app.after_request
+def add_server_timing(resp):
+    timings = getattr(g, 'timings', None)
+    if timings is None:
+        return resp
+
+    if app.config.get('SERVER_TIMING', True):
+        resp.headers.set('Server-Timing', timings.server_timing())
+
+    slow = app.config.get('SLOW_REQUEST_SECONDS')
+    if slow and timings.elapsed() > slow:
+        (seconds, statement) = timings.slowest
+        app.logger.warning("Slow request %s took %.2fs: %d queries in %.2fs, slowest (%.2fs): %s",
+            request.full_path, timings.elapsed(), timings.queries, timings.db, seconds, (statement or '')[:500])
+    return resp
+
+
+# Every cache key for a release lives under that release's generation, so
+# bumping the generation (python -m census_extractomatic.bump_cache) drops
+# one release's cached values without touching anything else. Generations
+# are kept in memcache and, so they survive a memcache restart, in S3.
+CACHE_GENERATION_KEY = 'cache_generation/%s'
+CACHE_GENERATIONS_S3_KEY = 'cache_generations.json'
+
+
+def load_cache_generations():
+    "The generations saved in S3 by the last bump, as a dict of release -> int."
+    bucket = get_s3_bucket()
+    if bucket is None:
+        return {}
+
+    try:
+        return json.loads(Key(bucket, CACHE_GENERATIONS_S3_KEY).get_contents_as_string())
+    except S3ResponseError:
+        return {}
+
+
+def cache_generation(release):
+    # Looked up at most once per request
+    generations = getattr(g, 'cache_generations', None)
+    if generations is None:
+        generations = g.cache_generations = {}
+
+    if release not in generations:
+        generation_key = str(CACHE_GENERATION_KEY % release)
+        generation = g.cache.get(generation_key)
+        if generation is None:
+            # memcache was restarted (or never told); fall back to S3 and
+            # remember the answer for everyone else
+            generation = load_cache_generations().get(release, 0)
+            g.cache.add(generation_key, generation)
+        generations[release] = int(generation)
+
+    return generations[release]
+
+
+def versioned_key(release, cache_key):
+    "`cache_key` in the namespace of `release`'s current cache generation."
+    generation = cache_generation(release)
+    if not generation:
+        return str(cache_key)
+    return str('v%d/%s' % (generation, cache_key))
+
+
+# Cache misses for the same key in this worker share one render, or wait
+# CACHE_LEASE_WAIT seconds for it before trying themselves
+cache_fills = SingleFlight(timeout=app.config.get('CACHE_LEASE_WAIT', 5))
+
+
+def fill_cache(cache_key, render, release, memcache=True, try_s3=True):
+    """Return `(value, etag)` for `cache_key`, calling `render` to make the
+    value and caching it if no tier has it. If `render` returns None, so
+    does this, and nothing is cached.
+
+    Concurrent misses in this worker wait for a single render. Across
+    workers, whoever wins a short memcache lease renders while the others
+    poll memcache for its result. Either way, a request renders the value
+    itself if it doesn't show up within CACHE_LEASE_WAIT seconds.
+
+    A stale value is returned straight away while it's re-rendered in the
+    background.
+    """
+    (cached, fresh, etag) = lookup_cache(cache_key, try_s3)
+    if cached:
+        if not fresh:
+            refresh_in_background(cache_key, render, release, memcache, try_s3)
+        if not etag:
+            # The ETag was evicted without the value, or never stored with it
+            etag = put_etag(cache_key, make_etag(release, cached))
+        return (cached, etag)
+
+    return cache_fills.do(cache_key, lambda: render_into_cache(cache_key, render, release, memcache, try_s3))
+
+
+def render_into_cache(cache_key, render, release, memcache=True, try_s3=True):
+    lease_key = cache_key + '.lease'
+    lease_ttl = current_app.config.get('CACHE_LEASE_TTL', 30)
+    try:
+        leased = g.cache.add(lease_key, os.getpid(), time=lease_ttl)
+    except Exception as e:
+        app.logger.warn('Rendering {} without a lease because {}'.format(cache_key, e.message))
+        leased = True
+
+    if not leased:
+        deadline = time.time() + current_app.config.get('CACHE_LEASE_WAIT', 5)
+        while time.time() < deadline:
+            time.sleep(0.1)
+            found = g.cache.get_multi([cache_key, etag_key(cache_key)])
+            cached = found.get(cache_key)
+            if cached:
+                local_cache.set(cache_key, cached)
+                return (cached, found.get(etag_key(cache_key)) or make_etag(release, cached))
+
+    try:
+        value = render()
+        if value is None:
+            return (None, None)
+
+        value = compress_value(value)
+        etag = make_etag(release, value)
+        try:
+            put_in_cache(cache_key, value, memcache=memcache, try_s3=try_s3, etag=etag)
+            if leased and not memcache:
+                # Hand the value to the workers polling for it
+                g.cache.set(cache_key, value, time=lease_ttl)
+        except Exception as e:
+            app.logger.warn('Skipping cache set for {} because {}'.format(cache_key, e.message))
+        return (value, etag)
+    finally:
+        if leased:
+            try:
+                g.cache.delete(lease_key)
+            except Exception:
+                pass
+
+
+# Keys being refreshed in the background by this worker
+refreshing = set()
+refreshing_lock = threading.Lock()
+refresh_slots = threading.BoundedSemaphore(app.config.get('CACHE_REFRESH_THREADS', 4))
 
-    if try_s3 and current_app.s3 is not None:
-        b = current_app.s3.get_bucket('embed.censusreporter.org', validate=False)
-        k = Key(b, cache_key)
-        k.metadata['Content-Type'] = content_type
-        k.set_contents_from_string(value, reduced_redundancy=True, policy='public-read')
+
+def refresh_in_background(cache_key, render, release, memcache=True, try_s3=True):
+    """Re-render a stale value in a background thread. Each key is refreshed
+    once at a time, and not at all if every refresh thread is busy; the
+    next request to find it stale will try again."""
+    with refreshing_lock:
+        if cache_key in refreshing or not refresh_slots.acquire(False):
+            return
+        refreshing.add(cache_key)
+
+    @copy_current_request_context
+    def refresh():
+        try:
+            # This thread gets its own app context, so its own g
+            open_connections()
+            render_into_cache(cache_key, render, release, memcache, try_s3)
+        except Exception as e:
+            app.logger.warn('Background refresh of {} failed: {}'.format(cache_key, e))
+        finally:
+            with refreshing_lock:
+                refreshing.discard(cache_key)
+            refresh_slots.release()
+
+    thread = threading.Thread(target=refresh, name='cache-refresh')
+    thread.daemon = True
+    thread.start()
+
+
+def make_etag(release, value):
+    """A strong ETag for `value`, which must be the (compressed) bytes as
+    they're cached, built from its release and a hash of those bytes. It's
+    worked out once, as the value is cached, and stored next to it."""
+    return '%s-%s' % (release, hashlib.sha1(value).hexdigest())
+
+
+def put_etag(cache_key, etag):
+    "Keep `etag` in the local tier and memcache next to `cache_key`'s value, and return it."
+    local_cache.set(etag_key(cache_key), etag)
+    try:
+        g.cache.set(etag_key(cache_key), etag, time=current_app.config.get('MEMCACHE_TTL', 0))
+    except Exception as e:
+        app.logger.warn('Skipping etag set for {} because {}'.format(cache_key, e.message))
+    return etag
+
+
+def not_modified(cache_key, cache_control=None):
+    """A 304 response if the client's If-None-Match matches the ETag stored
+    for `cache_key`, otherwise None. Only the ETag is looked up, so this is
+    cheap enough to do before fetching the value or rendering anything."""
+    if not request.if_none_match:
+        return None
+
+    start = time.time()
+    tier = 'local'
+    etag = local_cache.get(etag_key(cache_key))
+    if not etag:
+        tier = 'memcache'
+        soft_ttl = current_app.config.get('CACHE_SOFT_TTL', 0)
+        if soft_ttl:
+            found = g.cache.get_multi([etag_key(cache_key), fresh_key(cache_key)])
+            # Stale values are left to fill_cache, which refreshes them
+            if fresh_key(cache_key) in found:
+                etag = found.get(etag_key(cache_key))
+        else:
+            etag = g.cache.get(etag_key(cache_key))
+    if not etag:
+        return None
+
+    if request.if_none_match.contains(etag + '-gzip'):
+        etag = etag + '-gzip'
+    elif not request.if_none_match.contains(etag):
+        return None
+
+    # Conditional hits are counted apart from the tier's ordinary ones
+    record_cache_op(tier, 'etag', None, start)
+    g.cache_status = 'HIT-etag'
+    resp = make_response('', 304)
+    resp.set_etag(etag)
+    if cache_control:
+        resp.headers.set('Cache-Control', cache_control)
+    return resp
 
 
 def crossdomain(origin=None, methods=None, headers=None,
@@ -280,97 +807,6 @@ def maybe_int(i):
     return int(i) if i else i
 
 
-def percentify(val):
-    return val * 100
-
-
-def rateify(val):
-    return val * 1000
-
-
-def moe_add(moe_a, moe_b):
-    # From http://www.census.gov/acs/www/Downloads/handbooks/ACSGeneralHandbook.pdf
-    return math.sqrt(moe_a**2 + moe_b**2)
-
-
-def moe_ratio(numerator, denominator, numerator_moe, denominator_moe):
-    # From http://www.census.gov/acs/www/Downloads/handbooks/ACSGeneralHandbook.pdf
-    estimated_ratio = numerator / denominator
-    return math.sqrt(numerator_moe**2 + (estimated_ratio**2 * denominator_moe**2)) / denominator
-
-
-ops = {
-    '+': operator.add,
-    '-': operator.sub,
-    '/': operator.div,
-    '%': percentify,
-    '%%': rateify,
-}
-moe_ops = {
-    '+': moe_add,
-    '-': moe_add,
-    '/': moe_ratio,
-    '%': percentify,
-    '%%': rateify,
-}
-
-
-def value_rpn_calc(data, rpn_string):
-    stack = []
-    moe_stack = []
-    numerator = None
-    numerator_moe = None
-
-    for token in rpn_string.split():
-        if token in ops:
-            b = stack.pop()
-            b_moe = moe_stack.pop()
-
-            if token in ('%', '%%'):
-                # Single-argument operators
-                if b is None:
-                    c = None
-                    c_moe = None
-                else:
-                    c = ops[token](b)
-                    c_moe = moe_ops[token](b_moe)
-            else:
-                a = stack.pop()
-                a_moe = moe_stack.pop()
-
-                if a is None or b is None:
-                    c = None
-                    c_moe = None
-                elif token == '/':
-                    # Broken out because MOE ratio needs both MOE and estimates
-
-                    # We're dealing with ratios, not pure division.
-                    if a == 0 or b == 0:
-                        c = 0
-                        c_moe = 0
-                    else:
-                        c = ops[token](a, b)
-                        c_moe = moe_ratio(a, b, a_moe, b_moe)
-                    numerator = a
-                    numerator_moe = round(a_moe, 1)
-                else:
-                    c = ops[token](a, b)
-                    c_moe = moe_ops[token](a_moe, b_moe)
-        elif token.startswith('b'):
-            c = data[token]
-            c_moe = data[token + '_moe']
-        else:
-            c = float(token)
-            c_moe = float(token)
-        stack.append(c)
-        moe_stack.append(c_moe)
-
-    value = stack.pop()
-    error = moe_stack.pop()
-
-    return (value, error, numerator, numerator_moe)
-
-
 def build_item(name, data, parents, rpn_string):
     val = OrderedDict([('name', name),
         ('values', dict()),
@@ -378,27 +814,28 @@ def build_item(name, data, parents, rpn_string):
         ('numerators', dict()),
         ('numerator_errors', dict())])
 
-    for parent in parents:
-        label = parent['relation']
-        geoid = parent['geoid']
-        data_for_geoid = data.get(geoid) if data else {}
+    expression = compile_rpn(rpn_string)
+    geoids = [parent['geoid'] for parent in parents]
 
-        value = None
-        error = None
-        numerator = None
-        numerator_moe = None
+    if isinstance(data, rpn.ColumnArrays):
+        # provide 2 decimals of precision, let client decide how much to use
+        results = expression.evaluate_vectorized(data, geoids, decimals=2)
+    else:
+        results = []
+        for (value, error, numerator, numerator_moe) in expression.evaluate_many(data, geoids):
+            # provide 2 decimals of precision, let client decide how much to use
+            if value is not None:
+                value = round(value, 2)
+                error = round(error, 2)
 
-        if data_for_geoid:
-            (value, error, numerator, numerator_moe) = value_rpn_calc(data_for_geoid, rpn_string)
+            if numerator is not None:
+                numerator = round(numerator, 2)
+                numerator_moe = round(numerator_moe, 2)
 
-        # provide 2 decimals of precision, let client decide how much to use
-        if value is not None:
-            value = round(value, 2)
-            error = round(error, 2)
+            results.append((value, error, numerator, numerator_moe))
 
-        if numerator is not None:
-            numerator = round(numerator, 2)
-            numerator_moe = round(numerator_moe, 2)
+    for parent, (value, error, numerator, numerator_moe) in zip(parents, results):
+        label = parent['relation']
 
         val['values'][label] = value
         val['error'][label] = error
@@ -428,78 +865,274 @@ def find_geoid(geoid, acs=None):
     else:
         acs_to_search = allowed_acs
 
+    index = current_app.geoid_index
     for acs in acs_to_search:
+        if index is not None and index.covers(acs):
+            found = index.get(geoid, acs)
+            if found is not None:
+                return (acs, found)
+            continue
 
-        result = db.session.execute(
-            """SELECT geoid
-               FROM %s.geoheader
-               WHERE geoid=:geoid""" % acs,
-            {'geoid': geoid}
-        )
+        result = statements.execute(db.session, 'geoheader', acs, geoid)
         if result.rowcount == 1:
             result = result.first()
             return (acs, result['geoid'])
     return (None, None)
 
 
+app.geoid_index = None
+
+
+# Loaded as each worker takes its first request rather than on import, so
+# the command-line tools (and a preloading parent process) don't run the query.
+@app.before_first_request
+def load_geoid_index():
+    if not app.config.get('GEOID_INDEX'):
+        return
+
+    try:
+        with db.engine.connect() as conn:
+            app.geoid_index = GeoidReleaseIndex.load(conn, allowed_acs)
+        app.logger.info("Loaded geoid index with %d geoids", len(app.geoid_index))
+    except Exception, e:
+        app.logger.warning("Geoid index failed to load, validating geoids against the database instead: %s", e)
+
+
+app.availability = None
+
+
+@app.before_first_request
+def load_availability_matrix():
+    path = app.config.get('AVAILABILITY_MATRIX_PATH')
+    if not path:
+        return
+
+    try:
+        app.availability = AvailabilityMatrix.load(path)
+    except Exception, e:
+        app.logger.warning("Availability matrix failed to load from %s, trying every release instead: %s", path, e)
+
+
+# One memcache client per thread, made the first time that thread needs it
+# and kept for the life of the worker. pylibmc clients aren't thread-safe,
+# so they can't be shared between gunicorn's threads.
+memcache_clients = threading.local()
+
+
+def get_memcache_client(memcache_addr):
+    client = getattr(memcache_clients, 'client', None)
+    if client is None or memcache_clients.pid != os.getpid():
+        # Never reuse a connection inherited across a fork
+        client = pylibmc.Client(
+            memcache_addr,
+            binary=app.config.get('MEMCACHE_BINARY', True),
+            behaviors=app.config.get('MEMCACHE_BEHAVIORS', {})
+        )
+        memcache_clients.client = client
+        memcache_clients.pid = os.getpid()
+    return client
+
+
+def open_connections(heavy=False):
+    """Give this thread its memcache client, as g.cache, and point its
+    database session at a replica, which is kept as g.db_engine (None if
+    it's using the primary)."""
+    memcache_addr = app.config.get('MEMCACHE_ADDR')
+    g.cache = get_memcache_client(memcache_addr) if memcache_addr else mockcache.Client(memcache_addr)
+
+    engine = None
+    if heavy:
+        engine = heavy_replicas.engine()
+    engine = engine or replicas.engine()
+    if engine is not None:
+        db.session.bind = engine
+    g.db_engine = engine
+
+
 @app.before_request
 def before_request():
-    memcache_addr = app.config.get('MEMCACHE_ADDR')
-    g.cache = pylibmc.Client(memcache_addr) if memcache_addr else mockcache.Client(memcache_addr)
+    g.timings = RequestTimings()
+    open_connections(heavy=request.endpoint in HEAVY_ENDPOINTS)
 
 
-def get_data_fallback(table_ids, geoids, acs=None):
-    if type(geoids) != list:
-        geoids = [geoids]
+@app.teardown_request
+def eject_failed_replica(exc):
+    # Lost connections and the like, not errors in a query
+    engine = getattr(g, 'db_engine', None)
+    if engine is not None and (isinstance(exc, OperationalError) or getattr(exc, 'connection_invalidated', False)):
+        replicas.failed(engine, exc)
+        heavy_replicas.failed(engine, exc)
+
 
+def execute_heavy(sql, params):
+    """Run a read-only query on one of the heavy replicas, if there are any,
+    instead of the request's own connection. Returns all of its rows."""
+    engine = heavy_replicas.engine()
+    if engine is None or engine is getattr(g, 'db_engine', None):
+        return db.session.execute(sql, params).fetchall()
+
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(sql), params).fetchall()
+    except DBAPIError, e:
+        if isinstance(e, OperationalError) or e.connection_invalidated:
+            heavy_replicas.failed(engine, e)
+        raise
+
+
+def get_data_fallback(table_ids, geoids, acs=None):
     if type(table_ids) != list:
         table_ids = [table_ids]
 
-    from_stmt = '%%(acs)s.%s_moe' % (table_ids[0])
-    if len(table_ids) > 1:
-        from_stmt += ' '
-        from_stmt += ' '.join(['JOIN %%(acs)s.%s_moe USING (geoid)' % (table_id) for table_id in table_ids[1:]])
+    table_group = tuple(table_ids)
+    return get_profile_data([table_group], geoids, acs)[table_group]
+
 
-    sql = 'SELECT * FROM %s WHERE geoid IN :geoids;' % (from_stmt,)
+def get_profile_data(table_groups, geoids, acs=None):
+    """Fetch several table groups for the same geoids, a few tables per query.
+
+    Each item in `table_groups` is a table ID or a tuple of table IDs that
+    must come from the same release. Returns a dict mapping each item to a
+    `(data, acs)` pair, the same thing `get_data_fallback` would have given
+    for that group on its own.
+    """
+    if type(geoids) != list:
+        geoids = [geoids]
 
     # if acs is specified, we'll use that one and not go searching for data.
     if acs in allowed_acs:
-        sql = sql % {'acs': acs}
-        result = db.session.execute(
-            sql,
-            {'geoids': tuple(geoids)},
-        )
-        data = {}
-        for row in result.fetchall():
-            row = dict(row)
-            geoid = row.pop('geoid')
-            data[geoid] = dict([(col, val) for (col, val) in row.iteritems()])
+        acs_to_try = [acs]
+    else:
+        acs_to_try = allowed_acs
 
-        return data, acs
+    results = {}
+    remaining_groups = list(OrderedDict.fromkeys(table_groups))
+
+    # Skip releases we already know can't have every geoid's data for a group
+    candidates = {}
+    for group in remaining_groups:
+        if len(acs_to_try) == 1:
+            candidates[group] = acs_to_try
+        else:
+            candidates[group] = releases_with_data(acs_to_try, table_ids_for_group(group), geoids)
+
+    for acs in acs_to_try:
+        groups_to_fetch = [group for group in remaining_groups if acs in candidates[group]]
+        if not groups_to_fetch:
+            continue
+
+        table_ids = []
+        for group in groups_to_fetch:
+            for table_id in table_ids_for_group(group):
+                if table_id not in table_ids:
+                    table_ids.append(table_id)
+
+        # Start from the geoids themselves so a table that's missing one
+        # leaves its columns null rather than dropping the geoid for every
+        # group in the query.
+        data = {}
+        per_query = current_app.config.get('PROFILE_TABLES_PER_QUERY', 20)
+        for i in range(0, len(table_ids), per_query):
+            joins = ' '.join(['LEFT JOIN %s.%s_moe USING (geoid)' % (acs, table_id) for table_id in table_ids[i:i + per_query]])
+            sql = 'SELECT * FROM unnest(CAST(:geoids AS varchar[])) AS geoids(geoid) %s;' % joins
 
-    else:
-        # otherwise we'll start at the best/most recent acs and move down til we have the data we want
-        for acs in allowed_acs:
-            sql = sql % {'acs': acs}
             result = db.session.execute(
                 sql,
-                {'geoids': tuple(geoids)},
+                {'geoids': pg_array(geoids)},
             )
-            data = {}
             for row in result.fetchall():
                 row = dict(row)
                 geoid = row.pop('geoid')
-                data[geoid] = dict([(col, val) for (col, val) in row.iteritems()])
+                data.setdefault(geoid, {}).update(row)
 
-            # Check to see if this release has our data
-            data_with_values = filter(lambda geoid_data: geoid_data.values()[0] is not None, data.values())
-            if len(geoids) == len(data) and len(geoids) == len(data_with_values):
-                return data, acs
-            else:
-                # Doesn't contain data for all geoids, so keep going.
+        # Groups without values for every geoid move on to the next release
+        for group in groups_to_fetch:
+            if len(acs_to_try) == 1 or has_data_for_geoids(data, group, geoids):
+                results[group] = (data, acs)
+                remaining_groups.remove(group)
+
+        if not remaining_groups:
+            break
+
+    for group in remaining_groups:
+        results[group] = (None, acs_to_try[-1])
+
+    return results
+
+
+def releases_with_data(releases, table_ids, geoids):
+    """Narrow `releases` down to the ones that could have data for all of
+    `table_ids` at every geoid, going by the geoid index and availability
+    matrix where they're loaded. Releases they don't know about are kept."""
+    index = current_app.geoid_index
+    matrix = current_app.availability
+    sumlevels = set(geoid[:3] for geoid in geoids)
+
+    candidates = []
+    for release in releases:
+        if index is not None and index.covers(release):
+            if not all(index.contains(geoid, release) for geoid in geoids):
+                continue
+
+        if matrix is not None:
+            if any(matrix.status(release, table_id, sumlevel) == NOT_AVAILABLE
+                   for table_id in table_ids for sumlevel in sumlevels):
                 continue
 
-    return None, acs
+        candidates.append(release)
+
+    return candidates
+
+
+def latest_releases_to_try(releases, table_ids, geoids):
+    """The releases "latest" data should try in turn: the ones that could
+    have data, plus allowed_acs[1] wherever it was in the list, since it's
+    the last resort that returns what it has, nulls and all."""
+    with_data = releases_with_data(releases, table_ids, geoids)
+    return [release for release in releases if release in with_data or release == allowed_acs[1]]
+
+
+def table_ids_for_group(table_group):
+    if isinstance(table_group, basestring):
+        return [table_group]
+    return list(table_group)
+
+
+def has_data_for_geoids(data, table_group, geoids):
+    "True if `data` has a non-null first column of each table in the group for every geoid."
+    if len(geoids) != len(data):
+        return False
+
+    first_columns = ['%s001' % table_id.lower() for table_id in table_ids_for_group(table_group)]
+    for data_for_geoid in data.values():
+        for column in first_columns:
+            if data_for_geoid.get(column) is None:
+                return False
+
+    return True
+
+
+# Containment never changes within a TIGER vintage, so each worker remembers
+# the parents it has looked up.
+geo_containment_cache = LRUCache(app.config.get('GEO_CONTAINMENT_CACHE_SIZE', 20000))
+
+
+def get_geo_containment(geoid):
+    "A list of (parent_geoid, percent_covered) for the geoid, smallest coverage first."
+    parents = geo_containment_cache.get(geoid)
+
+    if parents is None:
+        result = db.session.execute(
+            """SELECT parent_geoid, percent_covered FROM %s.census_geo_containment
+               WHERE child_geoid=:geoid
+               ORDER BY percent_covered ASC
+            """ % profile_tiger_release,
+            {'geoid': geoid},
+        )
+        parents = tuple((row['parent_geoid'], row['percent_covered']) for row in result)
+        geo_containment_cache.set(geoid, parents)
+
+    return parents
 
 
 def compute_profile_item_levels(geoid):
@@ -523,20 +1156,13 @@ def compute_profile_item_levels(geoid):
     id_part = geoid_parts[1]
 
     if sumlevel in ('140', '150', '160', '310', '330', '350', '860', '950', '960', '970'):
-        result = db.session.execute(
-            """SELECT * FROM tiger2014.census_geo_containment
-               WHERE child_geoid=:geoid
-               ORDER BY percent_covered ASC
-            """,
-            {'geoid': geoid},
-        )
-        for row in result:
-            parent_sumlevel_name = SUMLEV_NAMES.get(row['parent_geoid'][:3])['name']
+        for (parent_geoid, percent_covered) in get_geo_containment(geoid):
+            parent_sumlevel_name = SUMLEV_NAMES.get(parent_geoid[:3])['name']
 
             levels.append({
                 'relation': parent_sumlevel_name,
-                'geoid': row['parent_geoid'],
-                'coverage': row['percent_covered'],
+                'geoid': parent_geoid,
+                'coverage': percent_covered,
             })
 
     if sumlevel in ('060', '140', '150'):
@@ -563,31 +1189,12 @@ def compute_profile_item_levels(geoid):
     return levels
 
 
-def geo_profile(acs, geoid):
-    acs_default = acs
-
-    item_levels = compute_profile_item_levels(geoid)
-    comparison_geoids = [level['geoid'] for level in item_levels]
-
-    doc = OrderedDict([('geography', OrderedDict()),
-                       ('demographics', dict()),
-                       ('economics', dict()),
-                       ('families', dict()),
-                       ('housing', dict()),
-                       ('social', dict())])
-
-    # Demographics: Age
-    # multiple data points, suitable for visualization
-    data, acs = get_data_fallback('B01001', comparison_geoids, acs_default)
+def build_geography_section(doc, profile_data, item_levels):
+    data, acs = profile_data['B01001']
     acs_name = ACS_NAMES.get(acs).get('name')
     doc['geography']['census_release'] = acs_name
 
-    result = db.session.execute(
-        """SELECT DISTINCT full_geoid,sumlevel,display_name,simple_name,aland
-           FROM tiger2014.census_name_lookup
-           WHERE full_geoid IN :geoids;""",
-        {'geoids': tuple(comparison_geoids)}
-    )
+    result = statements.execute(db.session, 'name_lookup', profile_tiger_release, pg_array(level['geoid'] for level in item_levels))
 
     def convert_geography_data(row):
         return dict(full_name=row['display_name'],
@@ -611,6 +1218,13 @@ def geo_profile(acs, geoid):
             doc['geography']['parents'][name] = convert_geography_data(lookup_data[the_geoid])
             doc['geography']['parents'][name]['total_population'] = maybe_int(data[the_geoid]['b01001001'])
 
+
+def build_demographics_section(doc, profile_data, item_levels):
+    # Demographics: Age
+    # multiple data points, suitable for visualization
+    data, acs = profile_data['B01001']
+    acs_name = ACS_NAMES.get(acs).get('name')
+
     age_dict = dict()
     doc['demographics']['age'] = age_dict
 
@@ -710,7 +1324,7 @@ def geo_profile(acs, geoid):
     sex_dict['percent_female'] = build_item('Female', data, item_levels,
         'b01001026 b01001001 / %')
 
-    data, acs = get_data_fallback('B01002', comparison_geoids, acs_default)
+    data, acs = profile_data['B01002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     median_age_dict = dict()
@@ -729,7 +1343,7 @@ def geo_profile(acs, geoid):
     # multiple data points, suitable for visualization
     # uses Table B03002 (HISPANIC OR LATINO ORIGIN BY RACE), pulling race numbers from "Not Hispanic or Latino" columns
     # also collapses smaller groups into "Other"
-    data, acs = get_data_fallback('B03002', comparison_geoids, acs_default)
+    data, acs = profile_data['B03002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     race_dict = OrderedDict()
@@ -764,9 +1378,11 @@ def geo_profile(acs, geoid):
     race_dict['percent_hispanic'] = build_item('Hispanic', data, item_levels,
         'b03002012 b03002001 / %')
 
+
+def build_economics_section(doc, profile_data, item_levels):
     # Economics: Per-Capita Income
     # single data point
-    data, acs = get_data_fallback('B19301', comparison_geoids, acs_default)
+    data, acs = profile_data['B19301']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     income_dict = dict()
@@ -778,7 +1394,7 @@ def geo_profile(acs, geoid):
 
     # Economics: Median Household Income
     # single data point
-    data, acs = get_data_fallback('B19013', comparison_geoids, acs_default)
+    data, acs = profile_data['B19013']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     income_dict['median_household_income'] = build_item('Median household income', data, item_levels,
@@ -787,7 +1403,7 @@ def geo_profile(acs, geoid):
 
     # Economics: Household Income Distribution
     # multiple data points, suitable for visualization
-    data, acs = get_data_fallback('B19001', comparison_geoids, acs_default)
+    data, acs = profile_data['B19001']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     income_distribution = OrderedDict()
@@ -805,7 +1421,7 @@ def geo_profile(acs, geoid):
 
     # Economics: Poverty Rate
     # provides separate dicts for children and seniors, with multiple data points, suitable for visualization
-    data, acs = get_data_fallback('B17001', comparison_geoids, acs_default)
+    data, acs = profile_data['B17001']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     poverty_dict = dict()
@@ -834,7 +1450,7 @@ def geo_profile(acs, geoid):
 
     # Economics: Mean Travel Time to Work, Means of Transportation to Work
     # uses two different tables for calculation, so make sure they draw from same ACS release
-    data, acs = get_data_fallback(['B08006', 'B08013'], comparison_geoids, acs_default)
+    data, acs = profile_data[('B08006', 'B08013')]
     acs_name = ACS_NAMES.get(acs).get('name')
 
     employment_dict = dict()
@@ -844,7 +1460,7 @@ def geo_profile(acs, geoid):
         'b08013001 b08006001 b08006017 - /')
     add_metadata(employment_dict['mean_travel_time'], 'b08006, b08013', 'Workers 16 years and over who did not work at home', acs_name)
 
-    data, acs = get_data_fallback('B08006', comparison_geoids, acs_default)
+    data, acs = profile_data['B08006']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     transportation_dict = OrderedDict()
@@ -866,8 +1482,10 @@ def geo_profile(acs, geoid):
     transportation_dict['worked_at_home'] = build_item('Worked at home', data, item_levels,
         'b08006017 b08006001 / %')
 
+
+def build_families_section(doc, profile_data, item_levels):
     # Families: Marital Status by Sex
-    data, acs = get_data_fallback('B12001', comparison_geoids, acs_default)
+    data, acs = profile_data['B12001']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     marital_status = OrderedDict()
@@ -934,7 +1552,7 @@ def geo_profile(acs, geoid):
 
 
     # Families: Family Types with Children
-    data, acs = get_data_fallback('B09002', comparison_geoids, acs_default)
+    data, acs = profile_data['B09002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     family_types = dict()
@@ -952,7 +1570,7 @@ def geo_profile(acs, geoid):
         'b09002015 b09002001 / %')
 
     # Families: Birth Rate by Women's Age
-    data, acs = get_data_fallback('B13016', comparison_geoids, acs_default)
+    data, acs = profile_data['B13016']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     fertility = dict()
@@ -982,7 +1600,7 @@ def geo_profile(acs, geoid):
         'b13016009 b13016009 b13016017 + / %')
 
     # Families: Number of Households, Persons per Household, Household type distribution
-    data, acs = get_data_fallback(['B11001', 'B11002'], comparison_geoids, acs_default)
+    data, acs = profile_data[('B11001', 'B11002')]
     acs_name = ACS_NAMES.get(acs).get('name')
 
     households_dict = dict()
@@ -1013,8 +1631,9 @@ def geo_profile(acs, geoid):
         'b11002012 b11002001 / %')
 
 
+def build_housing_section(doc, profile_data, item_levels):
     # Housing: Number of Housing Units, Occupancy Distribution, Vacancy Distribution
-    data, acs = get_data_fallback('B25002', comparison_geoids, acs_default)
+    data, acs = profile_data['B25002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     units_dict = dict()
@@ -1034,7 +1653,7 @@ def geo_profile(acs, geoid):
         'b25002003 b25002001 / %')
 
     # Housing: Structure Distribution
-    data, acs = get_data_fallback('B25024', comparison_geoids, acs_default)
+    data, acs = profile_data['B25024']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     structure_distribution_dict = OrderedDict()
@@ -1051,7 +1670,7 @@ def geo_profile(acs, geoid):
         'b25024011 b25024001 / %')
 
     # Housing: Tenure
-    data, acs = get_data_fallback('B25003', comparison_geoids, acs_default)
+    data, acs = profile_data['B25003']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     ownership_dict = dict()
@@ -1066,7 +1685,7 @@ def geo_profile(acs, geoid):
     ownership_distribution_dict['renter'] = build_item('Renter occupied', data, item_levels,
         'b25003003 b25003001 / %')
 
-    data, acs = get_data_fallback('B25026', comparison_geoids, acs_default)
+    data, acs = profile_data['B25026']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     length_of_tenure_dict = OrderedDict()
@@ -1087,7 +1706,7 @@ def geo_profile(acs, geoid):
         'b25026003 b25026010 + b25026001 / %')
 
     # Housing: Mobility
-    data, acs = get_data_fallback('B07003', comparison_geoids, acs_default)
+    data, acs = profile_data['B07003']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     migration_dict = dict()
@@ -1113,14 +1732,14 @@ def geo_profile(acs, geoid):
         'b07003016 b07003001 / %')
 
     # Housing: Median Value and Distribution of Values
-    data, acs = get_data_fallback('B25077', comparison_geoids, acs_default)
+    data, acs = profile_data['B25077']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     ownership_dict['median_value'] = build_item('Median value of owner-occupied housing units', data, item_levels,
         'b25077001')
     add_metadata(ownership_dict['median_value'], 'b25077', 'Owner-occupied housing units', acs_name)
 
-    data, acs = get_data_fallback('B25075', comparison_geoids, acs_default)
+    data, acs = profile_data['B25075']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     value_distribution = OrderedDict()
@@ -1146,10 +1765,11 @@ def geo_profile(acs, geoid):
         'b25075025 b25075001 / %')
 
 
+def build_social_section(doc, profile_data, item_levels):
     # Social: Educational Attainment
     # Two aggregated data points for "high school and higher," "college degree and higher"
     # and distribution dict for chart
-    data, acs = get_data_fallback('B15002', comparison_geoids, acs_default)
+    data, acs = profile_data['B15002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     attainment_dict = dict()
@@ -1183,7 +1803,7 @@ def geo_profile(acs, geoid):
         'b15002016 b15002017 + b15002018 + b15002033 + b15002034 + b15002035 + b15002001 / %')
 
     # Social: Place of Birth
-    data, acs = get_data_fallback('B05002', comparison_geoids, acs_default)
+    data, acs = profile_data['B05002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     foreign_dict = dict()
@@ -1193,7 +1813,7 @@ def geo_profile(acs, geoid):
         'b05002013 b05002001 / %')
     add_metadata(foreign_dict['percent_foreign_born'], 'b05002', 'Total population', acs_name)
 
-    data, acs = get_data_fallback('B05006', comparison_geoids, acs_default)
+    data, acs = profile_data['B05006']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     place_of_birth_dict = OrderedDict()
@@ -1214,7 +1834,7 @@ def geo_profile(acs, geoid):
         'b05006159 b05006001 / %')
 
     # Social: Percentage of Non-English Spoken at Home, Language Spoken at Home for Children, Adults
-    data, acs = get_data_fallback('B16001', comparison_geoids, acs_default)
+    data, acs = profile_data['B16001']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     language_dict = dict()
@@ -1225,7 +1845,7 @@ def geo_profile(acs, geoid):
     add_metadata(language_dict['percent_non_english_at_home'], 'b16001', 'Population 5 years and over', acs_name)
 
 
-    data, acs = get_data_fallback('B16007', comparison_geoids, acs_default)
+    data, acs = profile_data['B16007']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     language_children = OrderedDict()
@@ -1262,7 +1882,7 @@ def geo_profile(acs, geoid):
 
 
     # Social: Number of Veterans, Wartime Service, Sex of Veterans
-    data, acs = get_data_fallback('B21002', comparison_geoids, acs_default)
+    data, acs = profile_data['B21002']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     veterans_dict = dict()
@@ -1283,7 +1903,7 @@ def geo_profile(acs, geoid):
     veterans_service_dict['gulf_2001'] = build_item('Gulf (2001-)', data, item_levels,
         'b21002002 b21002003 + b21002004 +')
 
-    data, acs = get_data_fallback('B21001', comparison_geoids, acs_default)
+    data, acs = profile_data['B21001']
     acs_name = ACS_NAMES.get(acs).get('name')
 
     veterans_sex_dict = OrderedDict()
@@ -1304,11 +1924,69 @@ def geo_profile(acs, geoid):
         'b21001002 b21001001 / %')
     add_metadata(veterans_dict['percentage'], 'b21001', 'Civilian population 18 years and over', acs_name)
 
+
+# Each profile section, the function that fills it in and the tables (or
+# groups of tables that must share a release) it needs. The geography section
+# is always built.
+PROFILE_SECTIONS = OrderedDict([
+    ('geography', {'function': build_geography_section, 'tables': ['B01001']}),
+    ('demographics', {'function': build_demographics_section, 'tables': ['B01001', 'B01002', 'B03002']}),
+    ('economics', {'function': build_economics_section, 'tables': ['B19301', 'B19013', 'B19001', 'B17001', ('B08006', 'B08013'), 'B08006']}),
+    ('families', {'function': build_families_section, 'tables': ['B12001', 'B09002', 'B13016', ('B11001', 'B11002')]}),
+    ('housing', {'function': build_housing_section, 'tables': ['B25002', 'B25024', 'B25003', 'B25026', 'B07003', 'B25077', 'B25075']}),
+    ('social', {'function': build_social_section, 'tables': ['B15002', 'B05002', 'B05006', 'B16001', 'B16007', 'B21002', 'B21001']}),
+])
+
+
+def normalize_profile_sections(sections=None):
+    "Return the requested sections (all of them if none are given) in profile order, always including geography."
+    if not sections:
+        return PROFILE_SECTIONS.keys()
+
+    return [name for name in PROFILE_SECTIONS if name == 'geography' or name in sections]
+
+
+def pack_profile_data(profile_data, geoids):
+    """Pack each release's rows into ColumnArrays once per profile, for
+    build_item to evaluate every indicator against with NumPy."""
+    packed = {}
+    for (group, (data, acs)) in profile_data.items():
+        if data is None:
+            continue
+        # Groups fetched from the same release share one dict of rows
+        if id(data) not in packed:
+            packed[id(data)] = rpn.ColumnArrays(data, geoids)
+        profile_data[group] = (packed[id(data)], acs)
+    return profile_data
+
+
+def geo_profile(acs, geoid, sections=None):
+    acs_default = acs
+    sections = normalize_profile_sections(sections)
+
+    item_levels = compute_profile_item_levels(geoid)
+    comparison_geoids = [level['geoid'] for level in item_levels]
+
+    table_groups = []
+    for name in sections:
+        table_groups.extend(PROFILE_SECTIONS[name]['tables'])
+    profile_data = get_profile_data(table_groups, comparison_geoids, acs_default)
+    if current_app.config.get('PROFILE_VECTORIZE') and rpn.numpy is not None:
+        profile_data = pack_profile_data(profile_data, comparison_geoids)
+
+    doc = OrderedDict()
+    for name in sections:
+        doc[name] = OrderedDict() if name == 'geography' else dict()
+
+    for name in sections:
+        PROFILE_SECTIONS[name]['function'](doc, profile_data, item_levels)
+
     def default(obj):
         if type(obj) == decimal.Decimal:
             return int(obj)
 
-    return json.dumps(doc, default=default)
+    with timed('json'):
+        return json.dumps(doc, default=default)
 
 def get_acs_name(acs_slug):
     if acs_slug in ACS_NAMES:
@@ -1317,24 +1995,100 @@ def get_acs_name(acs_slug):
         acs_name = acs_slug
     return acs_name
 
+def profile_release_key(acs):
+    if acs == 'latest':
+        # "latest" resolves differently whenever a new release is added
+        return 'latest_%s' % allowed_acs[0]
+    return acs
+
+
+def profile_cache_key(acs, geoid, sections=None):
+    release_key = '%s/%s' % (profile_release_key(acs), profile_tiger_release)
+    tiger_generation = cache_generation(profile_tiger_release)
+    if tiger_generation:
+        release_key += '.v%d' % tiger_generation
+    sections = normalize_profile_sections(sections)
+    if len(sections) == len(PROFILE_SECTIONS):
+        cache_key = '1.0/%s/%s/profile.json' % (release_key, geoid)
+    else:
+        cache_key = '1.0/%s/%s/profile.%s.json' % (release_key, geoid, ','.join(sections))
+
+    return versioned_key(acs, cache_key)
+
+
+def use_profile_cache():
+    return current_app.config.get('PROFILE_CACHE', True) and not request.qwargs.nocache
+
+
+def get_or_render_profile(acs, geoid, render, sections=None):
+    """The cached profile, or the one `render` returns (which is then
+    cached), and its ETag. Uncached profiles don't get one."""
+    if not use_profile_cache():
+        return (render(), None)
+
+    cache_key = profile_cache_key(acs, geoid, sections)
+    return fill_cache(cache_key, render, profile_release_key(acs), try_s3=current_app.config.get('PROFILE_CACHE_S3', False))
+
+
+def profile_not_modified(acs, geoid, sections=None):
+    if not use_profile_cache():
+        return None
+
+    return not_modified(profile_cache_key(acs, geoid, sections))
+
+
+# Example: /1.0/acs2014_5yr/16000US1714000/profile
+# Example: /1.0/acs2014_5yr/16000US1714000/profile?sections=economics,housing
 @app.route("/1.0/<acs>/<geoid>/profile")
+@qwarg_validate({
+    'sections': {'valid': StringList(item_validator=OneOf(PROFILE_SECTIONS))},
+    'nocache': {'valid': Bool(), 'default': False}
+})
 def acs_geo_profile(acs, geoid):
-    valid_acs, valid_geoid = find_geoid(geoid, acs)
+    # Before anything touches the cache with a key built from `acs`
+    if acs not in allowed_acs:
+        abort(404, "We don't have data for that release.")
 
-    if not valid_acs:
-        abort(404, 'GeoID %s isn\'t included in the %s release.' % (geoid, get_acs_name(acs)))
+    sections = request.qwargs.sections
+    resp = profile_not_modified(acs, geoid, sections)
+    if resp:
+        return resp
+
+    def render():
+        valid_acs, valid_geoid = find_geoid(geoid, acs)
+
+        if not valid_acs:
+            abort(404, 'GeoID %s isn\'t included in the %s release.' % (geoid, get_acs_name(acs)))
 
-    return geo_profile(valid_acs, valid_geoid)
+        return geo_profile(valid_acs, valid_geoid, sections)
 
+    (profile, etag) = get_or_render_profile(acs, geoid, render, sections)
+    return make_cached_response(profile, etag)
 
+
+# Example: /1.0/latest/16000US1714000/profile
+# Example: /1.0/latest/16000US1714000/profile?sections=demographics
 @app.route("/1.0/latest/<geoid>/profile")
+@qwarg_validate({
+    'sections': {'valid': StringList(item_validator=OneOf(PROFILE_SECTIONS))},
+    'nocache': {'valid': Bool(), 'default': False}
+})
 def latest_geo_profile(geoid):
-    valid_acs, valid_geoid = find_geoid(geoid)
+    sections = request.qwargs.sections
+    resp = profile_not_modified('latest', geoid, sections)
+    if resp:
+        return resp
+
+    def render():
+        valid_acs, valid_geoid = find_geoid(geoid)
+
+        if not valid_acs:
+            abort(404, 'None of the supported ACS releases include GeoID %s.' % (geoid))
 
-    if not valid_acs:
-        abort(404, 'None of the supported ACS releases include GeoID %s.' % (geoid))
+        return geo_profile("latest", valid_geoid, sections)
 
-    return geo_profile("latest", valid_geoid)
+    (profile, etag) = get_or_render_profile('latest', geoid, render, sections)
+    return make_cached_response(profile, etag)
 
 
 ## GEO LOOKUPS ##
@@ -1421,25 +2175,16 @@ def geo_tiles(release, sumlevel, zoom, x, y):
     if sumlevel == '010':
         abort(400, "Don't support US tiles")
 
-    cache_key = str('1.0/geo/%s/tiles/%s/%s/%s/%s.geojson' % (release, sumlevel, zoom, x, y))
-    cached = get_from_cache(cache_key)
-    if cached:
-        resp = make_response(cached)
-    else:
+    cache_key = versioned_key(release, '1.0/geo/%s/tiles/%s/%s/%s/%s.geojson' % (release, sumlevel, zoom, x, y))
+    resp = not_modified(cache_key, 'public,max-age=86400')
+    if resp:
+        return resp
+
+    def render():
         (miny, minx) = num2deg(x, y, zoom)
         (maxy, maxx) = num2deg(x + 1, y + 1, zoom)
 
-        result = db.session.execute(
-            """SELECT
-                ST_AsGeoJSON(ST_SimplifyPreserveTopology(
-                    ST_Intersection(ST_Buffer(ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326), 0.09, 'endcap=square'), geom),
-                    ST_Perimeter(geom) / 2500), 6) as geom,
-                full_geoid,
-                display_name
-               FROM %s.census_name_lookup
-               WHERE sumlevel=:sumlev AND ST_Intersects(ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326), geom)""" % (release,),
-            {'minx': minx, 'miny': miny, 'maxx': maxx, 'maxy': maxy, 'sumlev': sumlevel}
-        )
+        result = statements.execute(db.session, 'tile_features', release, minx, miny, maxx, maxy, sumlevel)
 
         results = []
         for row in result:
@@ -1452,14 +2197,11 @@ def geo_tiles(release, sumlevel, zoom, x, y):
                 "geometry": json.loads(row['geom'])
             })
 
-        result = json.dumps(dict(type="FeatureCollection", features=results))
-
-        resp = make_response(result)
-        try:
-            put_in_cache(cache_key, result, memcache=False)
-        except Exception as e:
-            app.logger.warn('Skipping cache set for {} because {}'.format(cache_key, e.message))
+        with timed('json'):
+            return json.dumps(dict(type="FeatureCollection", features=results))
 
+    (result, etag) = fill_cache(cache_key, render, release, memcache=False)
+    resp = make_cached_response(result, etag)
     resp.headers.set('Content-Type', 'application/json')
     resp.headers.set('Cache-Control', 'public,max-age=86400') # 1 day
     return resp
@@ -1481,28 +2223,16 @@ def geo_lookup(release, geoid):
     if len(geoid_parts) is not 2:
         abort(404, 'Invalid GeoID')
 
-    cache_key = str('1.0/geo/%s/show/%s.json?geom=%s' % (release, geoid, request.qwargs.geom))
-    cached = get_from_cache(cache_key)
-    if cached:
-        resp = make_response(cached)
-    else:
+    cache_key = versioned_key(release, '1.0/geo/%s/show/%s.json?geom=%s' % (release, geoid, request.qwargs.geom))
+    resp = not_modified(cache_key, 'public,max-age=%d' % int(3600*4))
+    if resp:
+        return resp
+
+    def render():
         if request.qwargs.geom:
-            result = db.session.execute(
-                """SELECT display_name,simple_name,sumlevel,full_geoid,population,aland,awater,
-                   ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,ST_Perimeter(geom) / 1700)) as geom
-                   FROM %s.census_name_lookup
-                   WHERE full_geoid=:geoid
-                   LIMIT 1""" % (release,),
-                {'geoid': geoid}
-            )
+            result = statements.execute(db.session, 'geo_lookup_geom', release, geoid)
         else:
-            result = db.session.execute(
-                """SELECT display_name,simple_name,sumlevel,full_geoid,population,aland,awater
-                   FROM %s.census_name_lookup
-                   WHERE full_geoid=:geoid
-                   LIMIT 1""" % (release,),
-                {'geoid': geoid}
-            )
+            result = statements.execute(db.session, 'geo_lookup', release, geoid)
 
         result = result.fetchone()
 
@@ -1516,9 +2246,10 @@ def geo_lookup(release, geoid):
 
         result = json.dumps(dict(type="Feature", properties=result, geometry=geom))
 
-        resp = make_response(result)
-        put_in_cache(cache_key, result)
+        return result
 
+    (cached, etag) = fill_cache(cache_key, render, release)
+    resp = make_cached_response(cached, etag)
     resp.headers.set('Content-Type', 'application/json')
     resp.headers.set('Cache-Control', 'public,max-age=%d' % int(3600*4))
 
@@ -1535,11 +2266,12 @@ def geo_parent(release, geoid):
 
     geoid = geoid.upper()
 
-    cache_key = str('%s/show/%s.parents.json' % (release, geoid))
-    cached = get_from_cache(cache_key)
-    if cached:
-        resp = make_response(cached)
-    else:
+    cache_key = versioned_key(release, '%s/show/%s.parents.json' % (release, geoid))
+    resp = not_modified(cache_key, 'public,max-age=%d' % int(3600*4))
+    if resp:
+        return resp
+
+    def render():
         try:
             parents = compute_profile_item_levels(geoid)
         except Exception, e:
@@ -1554,12 +2286,13 @@ def geo_parent(release, geoid):
             })
 
         if parent_geoids:
+            (where, params) = geoid_filter('full_geoid', parent_geoids)
             result = db.session.execute(
                 """SELECT display_name,sumlevel,full_geoid
                    FROM %s.census_name_lookup
-                   WHERE full_geoid IN :geoids
-                   ORDER BY sumlevel DESC""" % (release,),
-                {'geoids': tuple(parent_geoids)}
+                   WHERE %s
+                   ORDER BY sumlevel DESC""" % (release, where),
+                params
             )
             parent_list = dict([build_item(p) for p in result])
 
@@ -1568,9 +2301,10 @@ def geo_parent(release, geoid):
 
         result = json.dumps(dict(parents=parents))
 
-        resp = make_response(result)
-        put_in_cache(cache_key, result)
+        return result
 
+    (cached, etag) = fill_cache(cache_key, render, release)
+    resp = make_cached_response(cached, etag)
     resp.headers.set('Content-Type', 'application/json')
     resp.headers.set('Cache-Control', 'public,max-age=%d' % int(3600*4))
 
@@ -1593,6 +2327,7 @@ def show_specified_geo_data(release):
     if len(geo_ids) > max_geoids:
         abort(400, 'You requested %s geoids. The maximum is %s. Please contact us for bulk data.' % (len(geo_ids), max_geoids))
 
+    (where, params) = geoid_filter('full_geoid', geo_ids)
     result = db.session.execute(
         """SELECT full_geoid,
             display_name,
@@ -1601,8 +2336,8 @@ def show_specified_geo_data(release):
             population,
             ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,ST_Perimeter(geom) / 2500)) as geom
            FROM %s.census_name_lookup
-           WHERE geom is not null and full_geoid IN :geoids;""" % (release,),
-        {'geoids': tuple(geo_ids)}
+           WHERE geom is not null and %s;""" % (release, where),
+        params
     )
 
     results = []
@@ -1625,10 +2360,11 @@ def show_specified_geo_data(release):
     if invalid_geo_ids:
         abort(404, "GeoID(s) %s are not valid." % (','.join(invalid_geo_ids)))
 
-    resp_data = json.dumps({
-        'type': 'FeatureCollection',
-        'features': results
-    })
+    with timed('json'):
+        resp_data = json.dumps({
+            'type': 'FeatureCollection',
+            'features': results
+        })
 
     resp = make_response(resp_data)
     resp.headers['Content-Type'] = 'application/json'
@@ -1694,15 +2430,14 @@ def table_search():
         ids_found = set()
         while table_id_acs:
             # Matching for table id
-            db.session.execute("SET search_path=:acs, public;", {'acs': table_id_acs})
             result = db.session.execute(
                 """SELECT tab.table_id,
                           tab.table_title,
                           tab.simple_table_title,
                           tab.universe,
                           tab.topics
-                   FROM census_table_metadata tab
-                   WHERE lower(table_id) like lower(:table_id)""",
+                   FROM %s.census_table_metadata tab
+                   WHERE lower(table_id) like lower(:table_id)""" % (table_id_acs,),
                 {'table_id': '{}%'.format(q)}
             )
             for row in result:
@@ -1717,7 +2452,6 @@ def table_search():
             data.sort(key=lambda x: x['unique_key'])
             return json.dumps(data)
 
-    db.session.execute("SET search_path=:acs, public;", {'acs': acs})
     table_where_parts = []
     table_where_args = {}
     column_where_parts = []
@@ -1779,10 +2513,10 @@ def table_search():
                       tab.simple_table_title,
                       tab.universe,
                       tab.topics
-               FROM census_column_metadata col
-               LEFT OUTER JOIN census_table_metadata tab USING (table_id)
+               FROM %s.census_column_metadata col
+               LEFT OUTER JOIN %s.census_table_metadata tab USING (table_id)
                WHERE %s
-               ORDER BY char_length(tab.table_id), tab.table_id""" % (column_where),
+               ORDER BY char_length(tab.table_id), tab.table_id""" % (acs, acs, column_where),
             column_where_args
         )
         data.extend([format_table_search_result(column, 'column') for column in result])
@@ -1838,19 +2572,13 @@ def table_details(table_id):
 
     table_id = table_id.upper() if table_id else table_id
 
-    cache_key = str('tables/%s/%s.json' % (release, table_id))
-    cached = get_from_cache(cache_key)
-    if cached:
-        resp = make_response(cached)
-    else:
-        db.session.execute("SET search_path=:acs, public;", {'acs': request.qwargs.acs})
+    cache_key = versioned_key(release, 'tables/%s/%s.json' % (release, table_id))
+    resp = not_modified(cache_key, 'public,max-age=%d' % int(3600*4))
+    if resp:
+        return resp
 
-        result = db.session.execute(
-            """SELECT *
-               FROM census_table_metadata tab
-               WHERE table_id=:table_id""",
-            {'table_id': table_id}
-        )
+    def render():
+        result = statements.execute(db.session, 'table_metadata', release, table_id)
         row = result.fetchone()
 
         if not row:
@@ -1866,12 +2594,7 @@ def table_details(table_id):
             ("topics", row['topics'])
         ])
 
-        result = db.session.execute(
-            """SELECT *
-               FROM census_column_metadata
-               WHERE table_id=:table_id""",
-            {'table_id': row['table_id']}
-        )
+        result = statements.execute(db.session, 'column_metadata', release, row['table_id'])
 
         rows = []
         for row in result:
@@ -1884,9 +2607,10 @@ def table_details(table_id):
 
         result = json.dumps(data)
 
-        resp = make_response(result)
-        put_in_cache(cache_key, result)
+        return result
 
+    (cached, etag) = fill_cache(cache_key, render, release)
+    resp = make_cached_response(cached, etag)
     resp.headers.set('Content-Type', 'application/json')
     resp.headers.set('Cache-Control', 'public,max-age=%d' % int(3600*4))
 
@@ -1907,23 +2631,17 @@ def table_details_with_release(release, table_id):
     table_id = table_id.upper() if table_id else table_id
 
     for release in acs_to_try:
-        cache_key = str('tables/%s/%s.json' % (release, table_id))
-        cached = get_from_cache(cache_key)
-        if cached:
-            resp = make_response(cached)
-        else:
-            db.session.execute("SET search_path=:acs, public;", {'acs': release})
+        cache_key = versioned_key(release, 'tables/%s/%s.json' % (release, table_id))
+        resp = not_modified(cache_key, 'public,max-age=%d' % int(3600*4))
+        if resp:
+            return resp
 
-            result = db.session.execute(
-                """SELECT *
-                   FROM census_table_metadata tab
-                   WHERE table_id=:table_id""",
-                {'table_id': table_id}
-            )
+        def render(release=release):
+            result = statements.execute(db.session, 'table_metadata', release, table_id)
             row = result.fetchone()
 
             if not row:
-                continue
+                return None
 
             data = OrderedDict([
                 ("table_id", row['table_id']),
@@ -1935,12 +2653,7 @@ def table_details_with_release(release, table_id):
                 ("topics", row['topics'])
             ])
 
-            result = db.session.execute(
-                """SELECT *
-                   FROM census_column_metadata
-                   WHERE table_id=:table_id""",
-                {'table_id': row['table_id']}
-            )
+            result = statements.execute(db.session, 'column_metadata', release, row['table_id'])
 
             rows = []
             for row in result:
@@ -1951,11 +2664,13 @@ def table_details_with_release(release, table_id):
                 )))
             data['columns'] = OrderedDict(rows)
 
-            result = json.dumps(data)
+            return json.dumps(data)
 
-            resp = make_response(result)
-            put_in_cache(cache_key, result)
+        (cached, etag) = fill_cache(cache_key, render, release)
+        if cached is None:
+            continue
 
+        resp = make_cached_response(cached, etag)
         resp.headers.set('Content-Type', 'application/json')
         resp.headers.set('Cache-Control', 'public,max-age=%d' % int(3600*4))
 
@@ -1987,18 +2702,12 @@ def table_geo_comparison_rowcount(table_id):
     releases = sorted(releases)
 
     for acs in releases:
-        db.session.execute("SET search_path=:acs, public;", {'acs': acs})
         release = OrderedDict()
         release['release_name'] = ACS_NAMES[acs]['name']
         release['release_slug'] = acs
         release['results'] = 0
 
-        result = db.session.execute(
-            """SELECT *
-               FROM census_table_metadata
-               WHERE table_id=:table_id;""",
-            {'table_id': table_id}
-        )
+        result = statements.execute(db.session, 'table_metadata', acs, table_id)
         table_record = result.fetchone()
         if table_record:
             validated_table_id = table_record['table_id']
@@ -2009,11 +2718,12 @@ def table_geo_comparison_rowcount(table_id):
 
             if child_geoheaders:
                 child_geoids = [child['geoid'] for child in child_geoheaders]
+                (where, params) = geoid_filter('geoid', child_geoids)
                 result = db.session.execute(
                     """SELECT COUNT(*)
                        FROM %s.%s
-                       WHERE geoid IN :geoids""" % (acs, validated_table_id),
-                    {'geoids': tuple(child_geoids)}
+                       WHERE %s""" % (acs, validated_table_id, where),
+                    params
                 )
                 acs_rowcount = result.fetchone()
                 release['results'] = acs_rowcount['count']
@@ -2330,12 +3040,11 @@ def get_child_geoids(release, parent_geoid, child_summary_level):
 
 
 def get_all_child_geoids(release, child_summary_level):
-    db.session.execute("SET search_path=:acs,public;", {'acs': release})
     result = db.session.execute(
         """SELECT geoid,name
-           FROM geoheader
+           FROM %s.geoheader
            WHERE sumlevel=:sumlev AND component='00' AND geoid NOT IN ('04000US72')
-           ORDER BY name""",
+           ORDER BY name""" % (release,),
         {'sumlev': int(child_summary_level)}
     )
 
@@ -2344,13 +3053,12 @@ def get_all_child_geoids(release, child_summary_level):
 
 def get_child_geoids_by_coverage(release, parent_geoid, child_summary_level):
     # Use the "worst"/biggest ACS to find all child geoids
-    db.session.execute("SET search_path=:acs,public;", {'acs': release})
     result = db.session.execute(
         """SELECT geoid, name
-           FROM tiger2014.census_geo_containment, geoheader
+           FROM tiger2014.census_geo_containment, %s.geoheader
            WHERE geoheader.geoid = census_geo_containment.child_geoid
              AND census_geo_containment.parent_geoid = :parent_geoid
-             AND census_geo_containment.child_geoid LIKE :child_geoids""",
+             AND census_geo_containment.child_geoid LIKE :child_geoids""" % (release,),
         {'parent_geoid': parent_geoid, 'child_geoids': child_summary_level+'%'}
     )
 
@@ -2367,7 +3075,7 @@ def get_child_geoids_by_coverage(release, parent_geoid, child_summary_level):
 def get_child_geoids_by_gis(release, parent_geoid, child_summary_level):
     parent_sumlevel = parent_geoid[0:3]
     child_geoids = []
-    result = db.session.execute(
+    result = execute_heavy(
         """SELECT child.full_geoid
            FROM tiger2014.census_name_lookup parent
            JOIN tiger2014.census_name_lookup child ON ST_Intersects(parent.geom, child.geom) AND child.sumlevel=:child_sumlevel
@@ -2378,13 +3086,13 @@ def get_child_geoids_by_gis(release, parent_geoid, child_summary_level):
 
     if child_geoids:
         # Use the "worst"/biggest ACS to find all child geoids
-        db.session.execute("SET search_path=:acs,public;", {'acs': release})
+        (where, params) = geoid_filter('geoid', child_geoids)
         result = db.session.execute(
             """SELECT geoid,name
-               FROM geoheader
-               WHERE geoid IN :child_geoids
-               ORDER BY name""",
-            {'child_geoids': tuple(child_geoids)}
+               FROM %s.geoheader
+               WHERE %s
+               ORDER BY name""" % (release, where),
+            params
         )
         return result.fetchall()
     else:
@@ -2395,13 +3103,12 @@ def get_child_geoids_by_prefix(release, parent_geoid, child_summary_level):
     child_geoid_prefix = '%s00US%s%%' % (child_summary_level, parent_geoid.upper().split('US')[1])
 
     # Use the "worst"/biggest ACS to find all child geoids
-    db.session.execute("SET search_path=:acs,public;", {'acs': release})
     result = db.session.execute(
         """SELECT geoid,name
-           FROM geoheader
+           FROM %s.geoheader
            WHERE geoid LIKE :geoid_prefix
              AND name NOT LIKE :not_name
-           ORDER BY geoid""",
+           ORDER BY geoid""" % (release,),
         {'geoid_prefix': child_geoid_prefix, 'not_name': '%%not defined%%'}
     )
     return result.fetchall()
@@ -2432,13 +3139,16 @@ def expand_geoids(geoid_list, release=None):
     valid_geo_ids.extend(expanded_geoids)
 
     # Check to make sure the geo ids the user entered are valid
-    if explicit_geoids:
-        db.session.execute("SET search_path=:acs,public;", {'acs': release})
+    index = current_app.geoid_index
+    if explicit_geoids and index is not None and index.covers(release):
+        valid_geo_ids.extend(filter(None, [index.get(geoid, release) for geoid in explicit_geoids]))
+    elif explicit_geoids:
+        (where, params) = geoid_filter('geoid', explicit_geoids)
         result = db.session.execute(
             """SELECT geoid
-               FROM geoheader
-               WHERE geoid IN :geoids;""",
-            {'geoids': tuple(explicit_geoids)}
+               FROM %s.geoheader
+               WHERE %s;""" % (release, where),
+            params
         )
         valid_geo_ids.extend([geo['geoid'] for geo in result])
 
@@ -2453,6 +3163,22 @@ class ShowDataException(Exception):
     pass
 
 
+def stream_query(sql, params):
+    """Execute `sql` through a server-side cursor, so its rows come from
+    Postgres in batches as they're iterated instead of all at once."""
+    conn = db.session.connection().execution_options(stream_results=True)
+    return conn.execute(text(sql), params)
+
+
+def send_spooled(out, content_type):
+    "A response that sends the contents of file `out` in chunks, then closes it."
+    size = out.tell()
+    out.seek(0)
+    resp = app.response_class(FileWrapper(out, 64 * 1024), content_type=content_type, direct_passthrough=True)
+    resp.content_length = size
+    return resp
+
+
 # Example: /1.0/data/show/acs2012_5yr?table_ids=B01001,B01003&geo_ids=04000US55,04000US56
 # Example: /1.0/data/show/latest?table_ids=B01001&geo_ids=160|04000US17,04000US56
 @app.route("/1.0/data/show/<acs>")
@@ -2481,6 +3207,9 @@ def show_specified_data(acs):
     if not valid_geo_ids:
         abort(404, 'None of the geo_ids specified were valid: %s' % ', '.join(requested_geo_ids))
 
+    if len(acs_to_try) > 1:
+        acs_to_try = latest_releases_to_try(acs_to_try, request.qwargs.table_ids, valid_geo_ids)
+
     max_geoids = current_app.config.get('MAX_GEOIDS_TO_SHOW', 1000)
     if len(valid_geo_ids) > max_geoids:
         abort(400, 'You requested %s geoids. The maximum is %s. Please contact us for bulk data.' % (len(valid_geo_ids), max_geoids))
@@ -2493,11 +3222,12 @@ def show_specified_data(acs):
     named_geo_ids = valid_geo_ids | parents_of_groups
 
     # Fill in the display name for the geos
+    (where, params) = geoid_filter('full_geoid', named_geo_ids)
     result = db.session.execute(
         """SELECT full_geoid,population,display_name
            FROM tiger2014.census_name_lookup
-           WHERE full_geoid IN :geoids;""",
-        {'geoids': tuple(named_geo_ids)}
+           WHERE %s;""" % (where,),
+        params
     )
 
     geo_metadata = OrderedDict()
@@ -2512,23 +3242,8 @@ def show_specified_data(acs):
 
     for acs in acs_to_try:
         try:
-            db.session.execute("SET search_path=:acs, public;", {'acs': acs})
-
             # Check to make sure the tables requested are valid
-            result = db.session.execute(
-                """SELECT tab.table_id,
-                          tab.table_title,
-                          tab.universe,
-                          tab.denominator_column_id,
-                          col.column_id,
-                          col.column_title,
-                          col.indent
-                   FROM census_column_metadata col
-                   LEFT JOIN census_table_metadata tab USING (table_id)
-                   WHERE table_id IN :table_ids
-                   ORDER BY column_id;""",
-                {'table_ids': tuple(request.qwargs.table_ids)}
-            )
+            result = statements.execute(db.session, 'table_columns', acs, pg_array(request.qwargs.table_ids))
 
             valid_table_ids = []
             table_metadata = OrderedDict()
@@ -2552,66 +3267,82 @@ def show_specified_data(acs):
                 raise ShowDataException("The %s release doesn't include table(s) %s." % (get_acs_name(acs), ','.join(invalid_table_ids)))
 
             # Now fetch the actual data
-            from_stmt = '%s_moe' % (valid_table_ids[0])
+            from_stmt = '%s.%s_moe' % (acs, valid_table_ids[0])
             if len(valid_table_ids) > 1:
                 from_stmt += ' '
-                from_stmt += ' '.join(['JOIN %s_moe USING (geoid)' % (table_id) for table_id in valid_table_ids[1:]])
-
-            sql = 'SELECT * FROM %s WHERE geoid IN :geoids;' % (from_stmt,)
+                from_stmt += ' '.join(['JOIN %s.%s_moe USING (geoid)' % (acs, table_id) for table_id in valid_table_ids[1:]])
 
-            result = db.session.execute(sql, {'geoids': tuple(valid_geo_ids)})
-            data = OrderedDict()
+            (where, params) = geoid_filter('geoid', valid_geo_ids)
+            sql = 'SELECT * FROM %s WHERE %s' % (from_stmt, where)
 
-            if result.rowcount != len(valid_geo_ids):
-                returned_geo_ids = set([row['geoid'] for row in result])
-                raise ShowDataException("The %s release doesn't include GeoID(s) %s." % (get_acs_name(acs), ','.join(set(valid_geo_ids) - returned_geo_ids)))
-
-            for row in result:
-                row = dict(row)
-                geoid = row.pop('geoid')
-                data_for_geoid = OrderedDict()
-
-                # If we end up at the 'most complete' release, we should include every bit of
-                # data we can instead of erroring out on the user.
-                # See https://www.pivotaltracker.com/story/show/70906084
-                this_geo_has_data = False or acs == allowed_acs[1]
-
-                cols_iter = iter(sorted(row.items(), key=lambda tup: tup[0]))
-                for table_id, data_iter in groupby(cols_iter, lambda x: x[0][:-3].upper()):
-                    table_for_geoid = OrderedDict()
-                    table_for_geoid['estimate'] = OrderedDict()
-                    table_for_geoid['error'] = OrderedDict()
-
-                    for (col_name, value) in data_iter:
-                        col_name = col_name.upper()
-                        (moe_name, moe_value) = next(cols_iter)
-
-                        if value is not None and moe_value is not None:
-                            this_geo_has_data = True
-
-                        table_for_geoid['estimate'][col_name] = value
-                        table_for_geoid['error'][col_name] = moe_value
-
-                    if this_geo_has_data:
-                        data_for_geoid[table_id] = table_for_geoid
-                    else:
-                        raise ShowDataException("The %s release doesn't have data for table %s, geoid %s." % (get_acs_name(acs), table_id, geoid))
-
-                data[geoid] = data_for_geoid
-
-            resp_data = json.dumps({
-                'tables': table_metadata,
-                'geography': geo_metadata,
-                'data': data,
-                'release': {
-                    'id': acs,
-                    'years': ACS_NAMES[acs]['years'],
-                    'name': ACS_NAMES[acs]['name']
-                }
-            })
-            resp = make_response(resp_data)
-            resp.headers['Content-Type'] = 'application/json'
-            return resp
+            # Write the response out a geoid at a time as rows stream in, so
+            # only one batch of rows is in memory. It's spooled to disk once
+            # it's over RESPONSE_SPOOL_BYTES and only sent once it's complete,
+            # so a release missing data can still fall through to the next.
+            out = tempfile.SpooledTemporaryFile(max_size=current_app.config.get('RESPONSE_SPOOL_BYTES', 4 * 1024 * 1024))
+            try:
+                with timed('json'):
+                    out.write('{"tables": %s, "geography": %s, "release": %s, "data": {' % (
+                        json.dumps(table_metadata),
+                        json.dumps(geo_metadata),
+                        json.dumps({
+                            'id': acs,
+                            'years': ACS_NAMES[acs]['years'],
+                            'name': ACS_NAMES[acs]['name']
+                        })
+                    ))
+
+                returned_geo_ids = set()
+                result = stream_query(sql, params)
+                try:
+                    for row in result:
+                        # Building each geoid's data is part of turning rows into JSON
+                        with timed('json'):
+                            row = dict(row)
+                            geoid = row.pop('geoid')
+                            data_for_geoid = OrderedDict()
+
+                            # If we end up at the 'most complete' release, we should include every bit of
+                            # data we can instead of erroring out on the user.
+                            # See https://www.pivotaltracker.com/story/show/70906084
+                            this_geo_has_data = False or acs == allowed_acs[1]
+
+                            cols_iter = iter(sorted(row.items(), key=lambda tup: tup[0]))
+                            for table_id, data_iter in groupby(cols_iter, lambda x: x[0][:-3].upper()):
+                                table_for_geoid = OrderedDict()
+                                table_for_geoid['estimate'] = OrderedDict()
+                                table_for_geoid['error'] = OrderedDict()
+
+                                for (col_name, value) in data_iter:
+                                    col_name = col_name.upper()
+                                    (moe_name, moe_value) = next(cols_iter)
+
+                                    if value is not None and moe_value is not None:
+                                        this_geo_has_data = True
+
+                                    table_for_geoid['estimate'][col_name] = value
+                                    table_for_geoid['error'][col_name] = moe_value
+
+                                if this_geo_has_data:
+                                    data_for_geoid[table_id] = table_for_geoid
+                                else:
+                                    raise ShowDataException("The %s release doesn't have data for table %s, geoid %s." % (get_acs_name(acs), table_id, geoid))
+
+                            out.write('%s%s: %s' % (', ' if returned_geo_ids else '', json.dumps(geoid), json.dumps(data_for_geoid)))
+                        returned_geo_ids.add(geoid)
+                finally:
+                    # Don't leave the server-side cursor open if this release is abandoned
+                    result.close()
+
+                if len(returned_geo_ids) != len(valid_geo_ids):
+                    raise ShowDataException("The %s release doesn't include GeoID(s) %s." % (get_acs_name(acs), ','.join(set(valid_geo_ids) - returned_geo_ids)))
+
+                out.write('}}')
+            except:
+                out.close()
+                raise
+
+            return send_spooled(out, 'application/json')
         except ShowDataException, e:
             continue
     abort(400, str(e))
@@ -2645,14 +3376,18 @@ def download_specified_data(acs):
     if len(valid_geo_ids) > max_geoids:
         abort(400, 'You requested %s geoids. The maximum is %s. Please contact us for bulk data.' % (len(valid_geo_ids), max_geoids))
 
+    if len(acs_to_try) > 1:
+        acs_to_try = latest_releases_to_try(acs_to_try, request.qwargs.table_ids, valid_geo_ids)
+
     # Fill in the display name for the geos
+    (where, params) = geoid_filter('full_geoid', valid_geo_ids)
     result = db.session.execute(
         """SELECT full_geoid,
                   population,
                   display_name
            FROM tiger2014.census_name_lookup
-           WHERE full_geoid IN :geo_ids;""",
-        {'geo_ids': tuple(valid_geo_ids)}
+           WHERE %s;""" % (where,),
+        params
     )
 
     geo_metadata = OrderedDict()
@@ -2663,23 +3398,8 @@ def download_specified_data(acs):
 
     for acs in acs_to_try:
         try:
-            db.session.execute("SET search_path=:acs, public;", {'acs': acs})
-
             # Check to make sure the tables requested are valid
-            result = db.session.execute(
-                """SELECT tab.table_id,
-                          tab.table_title,
-                          tab.universe,
-                          tab.denominator_column_id,
-                          col.column_id,
-                          col.column_title,
-                          col.indent
-                   FROM census_column_metadata col
-                   LEFT JOIN census_table_metadata tab USING (table_id)
-                   WHERE table_id IN :table_ids
-                   ORDER BY column_id;""",
-                {'table_ids': tuple(request.qwargs.table_ids)}
-            )
+            result = statements.execute(db.session, 'table_columns', acs, pg_array(request.qwargs.table_ids))
 
             valid_table_ids = []
             table_metadata = OrderedDict()
@@ -2703,71 +3423,79 @@ def download_specified_data(acs):
                 raise ShowDataException("The %s release doesn't include table(s) %s." % (get_acs_name(acs), ','.join(invalid_table_ids)))
 
             # Now fetch the actual data
-            from_stmt = '%s_moe' % (valid_table_ids[0])
+            from_stmt = '%s.%s_moe' % (acs, valid_table_ids[0])
             if len(valid_table_ids) > 1:
                 from_stmt += ' '
-                from_stmt += ' '.join(['JOIN %s_moe USING (geoid)' % (table_id) for table_id in valid_table_ids[1:]])
-
-            sql = 'SELECT * FROM %s WHERE geoid IN :geo_ids;' % (from_stmt,)
-
-            result = db.session.execute(sql, {'geo_ids': tuple(valid_geo_ids)})
-            data = OrderedDict()
+                from_stmt += ' '.join(['JOIN %s.%s_moe USING (geoid)' % (acs, table_id) for table_id in valid_table_ids[1:]])
 
-            if result.rowcount != len(valid_geo_ids):
-                returned_geo_ids = set([row['geoid'] for row in result])
-                raise ShowDataException("The %s release doesn't include GeoID(s) %s." % (get_acs_name(acs), ','.join(set(valid_geo_ids) - returned_geo_ids)))
-
-            for row in result.fetchall():
-                row = dict(row)
-                geoid = row.pop('geoid')
-                data_for_geoid = OrderedDict()
-
-                cols_iter = iter(sorted(row.items(), key=lambda tup: tup[0]))
-                for table_id, data_iter in groupby(cols_iter, lambda x: x[0][:-3].upper()):
-                    table_for_geoid = OrderedDict()
-                    table_for_geoid['estimate'] = OrderedDict()
-                    table_for_geoid['error'] = OrderedDict()
-
-                    for (col_name, value) in data_iter:
-                        col_name = col_name.upper()
-                        (moe_name, moe_value) = next(cols_iter)
-
-                        table_for_geoid['estimate'][col_name] = value
-                        table_for_geoid['error'][col_name] = moe_value
-
-                    data_for_geoid[table_id] = table_for_geoid
-
-                data[geoid] = data_for_geoid
+            (where, params) = geoid_filter('geoid', valid_geo_ids)
+            sql = 'SELECT * FROM %s WHERE %s' % (from_stmt, where)
 
             temp_path = tempfile.mkdtemp()
-            file_ident = "%s_%s_%s" % (acs, next(iter(valid_table_ids)), next(iter(valid_geo_ids)))
-            inner_path = os.path.join(temp_path, file_ident)
-            os.mkdir(inner_path)
-            out_filename = os.path.join(inner_path, '%s.%s' % (file_ident, request.qwargs.format))
-            format_info = supported_formats.get(request.qwargs.format)
-            builder_func = format_info['function']
-            builder_func(app.config['SQLALCHEMY_DATABASE_URI'], data, table_metadata, valid_geo_ids, file_ident, out_filename, request.qwargs.format)
-
-            metadata_dict = {
-                'release': {
-                    'id': acs,
-                    'years': ACS_NAMES[acs]['years'],
-                    'name': ACS_NAMES[acs]['name']
-                },
-                'tables': table_metadata
-            }
-            json.dump(metadata_dict, open(os.path.join(inner_path, 'metadata.json'), 'w'), indent=4)
-
-            zfile_path = os.path.join(temp_path, file_ident + '.zip')
-            zfile = zipfile.ZipFile(zfile_path, 'w', zipfile.ZIP_DEFLATED)
-            for root, dirs, files in os.walk(inner_path):
-                for f in files:
-                    zfile.write(os.path.join(root, f), os.path.join(file_ident, f))
-            zfile.close()
+            # Rows stream in a batch at a time and each geoid's data waits on
+            # disk, rather than in memory, until the exporter wants it
+            data = shelve.open(os.path.join(temp_path, 'data'), protocol=2)
+            try:
+                returned_geo_ids = set()
+                result = stream_query(sql, params)
+                try:
+                    for row in result:
+                        row = dict(row)
+                        geoid = row.pop('geoid')
+                        data_for_geoid = OrderedDict()
+
+                        cols_iter = iter(sorted(row.items(), key=lambda tup: tup[0]))
+                        for table_id, data_iter in groupby(cols_iter, lambda x: x[0][:-3].upper()):
+                            table_for_geoid = OrderedDict()
+                            table_for_geoid['estimate'] = OrderedDict()
+                            table_for_geoid['error'] = OrderedDict()
+
+                            for (col_name, value) in data_iter:
+                                col_name = col_name.upper()
+                                (moe_name, moe_value) = next(cols_iter)
+
+                                table_for_geoid['estimate'][col_name] = value
+                                table_for_geoid['error'][col_name] = moe_value
+
+                            data_for_geoid[table_id] = table_for_geoid
+
+                        data[str(geoid)] = data_for_geoid
+                        returned_geo_ids.add(geoid)
+                finally:
+                    result.close()
+
+                if len(returned_geo_ids) != len(valid_geo_ids):
+                    raise ShowDataException("The %s release doesn't include GeoID(s) %s." % (get_acs_name(acs), ','.join(set(valid_geo_ids) - returned_geo_ids)))
+
+                file_ident = "%s_%s_%s" % (acs, next(iter(valid_table_ids)), next(iter(valid_geo_ids)))
+                inner_path = os.path.join(temp_path, file_ident)
+                os.mkdir(inner_path)
+                out_filename = os.path.join(inner_path, '%s.%s' % (file_ident, request.qwargs.format))
+                format_info = supported_formats.get(request.qwargs.format)
+                builder_func = format_info['function']
+                builder_func(g.db_engine or db.engine, data, table_metadata, valid_geo_ids, file_ident, out_filename, request.qwargs.format)
+
+                metadata_dict = {
+                    'release': {
+                        'id': acs,
+                        'years': ACS_NAMES[acs]['years'],
+                        'name': ACS_NAMES[acs]['name']
+                    },
+                    'tables': table_metadata
+                }
+                json.dump(metadata_dict, open(os.path.join(inner_path, 'metadata.json'), 'w'), indent=4)
 
-            resp = send_file(zfile_path, as_attachment=True, attachment_filename=file_ident + '.zip')
+                zfile_path = os.path.join(temp_path, file_ident + '.zip')
+                zfile = zipfile.ZipFile(zfile_path, 'w', zipfile.ZIP_DEFLATED)
+                for root, dirs, files in os.walk(inner_path):
+                    for f in files:
+                        zfile.write(os.path.join(root, f), os.path.join(file_ident, f))
+                zfile.close()
 
-            shutil.rmtree(temp_path)
+                resp = send_file(zfile_path, as_attachment=True, attachment_filename=file_ident + '.zip')
+            finally:
+                data.close()
+                shutil.rmtree(temp_path)
 
             return resp
         except ShowDataException, e:
@@ -2787,7 +3515,6 @@ def data_compare_geographies_within_parent(acs, table_id):
     # make sure we support the requested ACS release
     if acs not in allowed_acs:
         abort(404, 'The %s release isn\'t supported.' % get_acs_name(acs))
-    db.session.execute("SET search_path=:acs, public;", {'acs': acs})
 
     parent_geoid = request.qwargs.within
     child_summary_level = request.qwargs.sumlevel
@@ -2803,20 +3530,7 @@ def data_compare_geographies_within_parent(acs, table_id):
     comparison['child_geography_name'] = SUMLEV_NAMES.get(child_summary_level, {}).get('name')
     comparison['child_geography_name_plural'] = SUMLEV_NAMES.get(child_summary_level, {}).get('plural')
 
-    result = db.session.execute(
-        """SELECT tab.table_id,
-                  tab.table_title,
-                  tab.universe,
-                  tab.denominator_column_id,
-                  col.column_id,
-                  col.column_title,
-                  col.indent
-           FROM census_column_metadata col
-           LEFT JOIN census_table_metadata tab USING (table_id)
-           WHERE table_id=:table_ids
-           ORDER BY column_id;""",
-        {'table_ids': table_id}
-    )
+    result = statements.execute(db.session, 'table_columns', acs, pg_array([table_id]))
     table_metadata = result.fetchall()
 
     if not table_metadata:
@@ -2841,7 +3555,7 @@ def data_compare_geographies_within_parent(acs, table_id):
     table['columns'] = column_map
 
     # add some data about the parent geography
-    result = db.session.execute("SELECT * FROM geoheader WHERE geoid=:geoid;", {'geoid': parent_geoid})
+    result = statements.execute(db.session, 'geoheader', acs, parent_geoid)
     parent_geoheader = result.fetchone()
     parent_sumlevel = '%03d' % parent_geoheader['sumlevel']
 
@@ -2878,19 +3592,20 @@ def data_compare_geographies_within_parent(acs, table_id):
             pass
 
         # get the child geometries and store for later
+        (where, params) = geoid_filter('full_geoid', child_geoid_list)
         result = db.session.execute(
             """SELECT geoid, ST_AsGeoJSON(ST_SimplifyPreserveTopology(geom,0.001), 5) as geometry
                FROM tiger2014.census_name_lookup
-               WHERE full_geoid IN :geo_ids
-               ORDER BY full_geoid;""",
-            {'geo_ids': tuple(child_geoid_list)}
+               WHERE %s
+               ORDER BY full_geoid;""" % (where,),
+            params
         )
         child_geodata = result.fetchall()
         child_geodata_map = dict([(record['geoid'], json.loads(record['geometry'])) for record in child_geodata])
 
     # make the where clause and query the requested census data table
     # get parent data first...
-    result = db.session.execute("SELECT * FROM %s_moe WHERE geoid=:geoid" % (validated_table_id), {'geoid': parent_geoheader['geoid']})
+    result = db.session.execute("SELECT * FROM %s.%s_moe WHERE geoid=:geoid" % (acs, validated_table_id), {'geoid': parent_geoheader['geoid']})
     parent_data = result.fetchone()
     parent_data.pop('geoid', None)
     column_data = []
@@ -2906,7 +3621,8 @@ def data_compare_geographies_within_parent(acs, table_id):
     if child_geoheaders:
         # ... and then children so we can loop through with cursor
         child_geoids = [child['geoid'] for child in child_geoheaders]
-        result = db.session.execute("SELECT * FROM %s_moe WHERE geoid IN :geo_ids" % (validated_table_id), {'geo_ids': tuple(child_geoids)})
+        (where, params) = geoid_filter('geoid', child_geoids)
+        result = db.session.execute("SELECT * FROM %s.%s_moe WHERE %s" % (acs, validated_table_id, where), params)
 
         # grab one row at a time
         for record in result:
@@ -2949,13 +3665,29 @@ def data_compare_geographies_within_parent(acs, table_id):
     else:
         comparison['results'] = 0
 
-    return jsonify(comparison=comparison, table=table, parent_geography=parent_geography, child_geographies=child_geographies)
+    with timed('json'):
+        return jsonify(comparison=comparison, table=table, parent_geography=parent_geography, child_geographies=child_geographies)
 
 
 @app.route('/healthcheck')
 def healthcheck():
     return 'OK'
 
+@app.route('/healthcheck/cache')
+def cache_healthcheck():
+    return jsonify(
+        s3_uploads=s3_writer.stats(),
+        local_cache={'entries': len(local_cache), 'bytes': local_cache.nbytes},
+        endpoints=cache_metrics.snapshot()
+    )
+
+@app.route('/healthcheck/replicas')
+def replica_healthcheck():
+    return jsonify(
+        read=replicas.stats(),
+        heavy=heavy_replicas.stats()
+    )
+
 @app.route('/robots.txt')
 def robots_txt():
     response = make_response('User-agent: *\nDisallow: /\n')
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""Which ACS releases actually have data for which tables at which summary levels.
+
+Build the matrix once after each data load, from the root of the repository:
+
+    python -m census_extractomatic.availability --output /home/www-data/availability.json
+
+and point the API at it with the AVAILABILITY_MATRIX_PATH setting. The "latest"
+endpoints use it to skip releases that can't satisfy a request instead of
+querying each one in turn.
+
+"""
+import argparse
+import json
+import time
+
+# Values in the matrix
+ALL = 'all'    # every geography at the sumlevel has non-null values
+SOME = 'some'  # some do, some don't
+NONE = 'none'  # none do
+
+
+class AvailabilityMatrix(object):
+    def __init__(self, releases):
+        # {release: {table_id: {sumlevel: ALL|SOME|NONE}}}
+        self.releases = releases
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f)['releases'])
+
+    def status(self, release, table_id, sumlevel):
+        "ALL, SOME or NONE, or None if the matrix doesn't know about this combination."
+        return self.releases.get(release, {}).get(table_id.upper(), {}).get(sumlevel)
+
+
+def sumlevel_status(total, with_data):
+    if with_data == 0:
+        return NONE
+    elif with_data == total:
+        return ALL
+    else:
+        return SOME
+
+
+def build_release(session, release, table_ids=None):
+    "Count, per sumlevel, how many rows of each table have a non-null first estimate."
+    if not table_ids:
+        result = session.execute("SELECT table_id FROM %s.census_table_metadata ORDER BY table_id" % release)
+        table_ids = [row['table_id'] for row in result]
+
+    tables = {}
+    for table_id in table_ids:
+        table_id = table_id.upper()
+        try:
+            result = session.execute(
+                """SELECT substring(geoid from 1 for 3) AS sumlevel,
+                          count(*) AS total,
+                          count(%s001) AS with_data
+                   FROM %s.%s
+                   GROUP BY 1""" % (table_id.lower(), release, table_id)
+            )
+            tables[table_id] = dict(
+                (row['sumlevel'], sumlevel_status(row['total'], row['with_data'])) for row in result
+            )
+            session.commit()
+        except Exception, e:
+            # Tables we couldn't count (e.g. listed in the metadata but never
+            # loaded) get no sumlevels, so lookups treat them as unknown and
+            # the API still tries the release rather than skipping it.
+            session.rollback()
+            print "Skipping %s.%s: %s" % (release, table_id, e)
+            tables[table_id] = {}
+
+    return tables
+
+
+def main():
+    from census_extractomatic.api import app, db, allowed_acs
+
+    parser = argparse.ArgumentParser(description='Build the table x release x sumlevel availability matrix.')
+    parser.add_argument('--output', default='availability.json',
+                        help='Where to write the matrix (default: %(default)s)')
+    parser.add_argument('--releases', default=','.join(allowed_acs),
+                        help='Comma-separated releases to check (default: %(default)s)')
+    parser.add_argument('--tables',
+                        help='Comma-separated table IDs to check (default: every table in each release)')
+    args = parser.parse_args()
+
+    table_ids = args.tables.split(',') if args.tables else None
+    releases = {}
+    with app.app_context():
+        for release in args.releases.split(','):
+            start = time.time()
+            releases[release] = build_release(db.session, release, table_ids)
+            print "Checked %d tables in %s in %.0fs" % (len(releases[release]), release, time.time() - start)
+
+    with open(args.output, 'w') as f:
+        json.dump({'built': time.strftime('%Y-%m-%dT%H:%M:%S'), 'releases': releases}, f)
+    print "Wrote %s" % args.output
+
+
+if __name__ == '__main__':
+    main()
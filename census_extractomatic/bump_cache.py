@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Invalidate everything cached for one or more releases.
+
+    python -m census_extractomatic.bump_cache acs2015_1yr tiger2014
+
+Each release's cache generation is incremented, which moves all of its cache
+keys (in every tier) to a fresh namespace. Entries for other releases stay
+put. Bumping an ACS release also bumps "latest", whose profiles draw on
+every ACS release. Profiles are also keyed by the TIGER release their
+geography comes from, so bumping that one drops them too.
+
+"""
+import argparse
+import json
+
+from census_extractomatic.api import (app, allowed_acs, allowed_tiger, get_memcache_client, get_s3_bucket,
+    load_cache_generations, CACHE_GENERATION_KEY, CACHE_GENERATIONS_S3_KEY)
+from census_extractomatic.s3_writer import write_to_s3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Invalidate cached API responses for specific releases.')
+    parser.add_argument('releases', nargs='+', choices=allowed_acs + allowed_tiger + ['latest'],
+                        help='ACS or TIGER releases to invalidate')
+    args = parser.parse_args()
+
+    releases = list(args.releases)
+    if 'latest' not in releases and any(release in allowed_acs for release in releases):
+        releases.append('latest')
+
+    memcache_addr = app.config.get('MEMCACHE_ADDR')
+    with app.app_context():
+        cache = get_memcache_client(memcache_addr) if memcache_addr else None
+        generations = load_cache_generations()
+
+        for release in releases:
+            current = generations.get(release, 0)
+            if cache is not None:
+                current = max(current, int(cache.get(CACHE_GENERATION_KEY % release) or 0))
+            generations[release] = current + 1
+
+        # S3 first, so a memcache restart can't bring back the old generation
+        bucket = get_s3_bucket()
+        if bucket is not None:
+            write_to_s3(bucket, CACHE_GENERATIONS_S3_KEY, json.dumps(generations))
+
+        for release in releases:
+            if cache is not None:
+                cache.set(CACHE_GENERATION_KEY % release, generations[release])
+            print "%s is now at cache generation %d" % (release, generations[release])
+
+
+if __name__ == '__main__':
+    main()
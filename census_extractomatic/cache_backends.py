@@ -0,0 +1,246 @@
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+from boto.exception import S3ResponseError
+from boto.s3.key import Key
+
+from census_extractomatic.s3_writer import write_to_s3
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(object):
+    """A cache tier behind memcache. Tiers are checked in order by
+    get_from_cache and all written to by put_in_cache.
+
+    `get` returns `(value, age)`, where `age` is how many seconds ago the
+    value was stored (None if the tier can't tell), or `(None, None)` on a
+    miss. `set` returns what happened ('set', 'queued', 'dropped'); its
+    `age` is how old the value already is, for values copied from a slower
+    tier, where the tier can record it.
+    """
+
+    name = None
+    # Remote tiers are skipped when a caller asks not to use S3
+    remote = False
+
+    def enabled(self):
+        return True
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, content_type='application/json', write_behind=True, age=None):
+        raise NotImplementedError
+
+
+class DiskCache(CacheBackend):
+    """Values kept as files on local disk, under `root`.
+
+    Each key is stored at a path made from its SHA-1, sharded two levels
+    deep so no directory gets too big. Files are written to a temporary
+    name and renamed into place, so readers never see a partial value.
+    A file's mtime is when its value was rendered, and reads bump its atime,
+    though only once every `touch_interval` seconds so hot files aren't
+    touched on every read.
+
+    Every worker shares the same files, so their size is counted by
+    scanning the directory: a background thread does that every
+    `scan_interval` seconds, deleting the least recently read files until
+    they're back under 90% of `max_bytes` whenever they add up to more.
+    Between scans each worker adds its own writes to the last count, and
+    wakes the thread early if that goes over. Like S3WriteBehind, the
+    thread starts on first use in each process; with a `scan_interval` of
+    0 there's no thread, and nothing is evicted unless `evict` is called.
+    """
+
+    name = 'disk'
+
+    def __init__(self, root, max_bytes, scan_interval=300, touch_interval=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.scan_interval = scan_interval
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        # Bytes on disk as of the last scan, plus this worker's writes since
+        self._nbytes = None
+
+    def path(self, key):
+        digest = hashlib.sha1(key).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return (None, None)
+
+        with f:
+            stat = os.fstat(f.fileno())
+            if not stat.st_size:
+                return (None, None)
+            value = f.read()
+
+        now = time.time()
+        if now - stat.st_atime > self.touch_interval:
+            try:
+                # atime marks it recently used; mtime keeps when it was written
+                os.utime(path, (now, stat.st_mtime))
+            except OSError:
+                pass
+
+        return (value, now - stat.st_mtime)
+
+    def set(self, key, value, content_type='application/json', write_behind=True, age=None):
+        self._start_eviction()
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.rename(tmp_path, path)
+        except:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if age:
+            # Keep when a value copied from a slower tier was rendered
+            now = time.time()
+            os.utime(path, (now, now - age))
+
+        self._added(len(value))
+        return 'set'
+
+    def _added(self, nbytes):
+        with self._lock:
+            if self._nbytes is None:
+                # The first scan hasn't finished yet
+                return
+            self._nbytes += nbytes
+            over = self._nbytes > self.max_bytes
+
+        if over:
+            self._wake.set()
+
+    def _start_eviction(self):
+        if self.scan_interval and self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._nbytes = None
+                    self._wake = threading.Event()
+                    thread = threading.Thread(target=self._run, name='disk-cache-eviction')
+                    thread.daemon = True
+                    thread.start()
+                    self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                self.evict()
+            except Exception:
+                logger.exception("Disk cache eviction in %s failed", self.root)
+            self._wake.wait(self.scan_interval)
+            self._wake.clear()
+
+    def evict(self):
+        """Count the files on disk and, if they're over max_bytes, delete the
+        least recently read until they fit in 90% of it."""
+        try:
+            os.makedirs(self.root)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        with open(os.path.join(self.root, '.evict.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                # Another process is already at it
+                return
+
+            now = time.time()
+            entries = []
+            total = 0
+            for (dirpath, dirnames, filenames) in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    if filename.startswith('.tmp-') and stat.st_mtime < now - 3600:
+                        # Left behind by a writer that died
+                        try:
+                            os.unlink(path)
+                        except OSError:
+                            pass
+                    elif not filename.startswith('.'):
+                        entries.append((stat.st_atime, stat.st_size, path))
+                        total += stat.st_size
+
+            entries.sort()
+            target = self.max_bytes * 0.9 if total > self.max_bytes else total
+            for (atime, size, path) in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
+
+        with self._lock:
+            self._nbytes = total
+
+
+class S3Cache(CacheBackend):
+    """The embed.censusreporter.org bucket. Writes go through an
+    S3WriteBehind unless the caller asks to wait for them."""
+
+    name = 's3'
+    remote = True
+
+    def __init__(self, get_bucket, writer):
+        self.get_bucket = get_bucket
+        self.writer = writer
+
+    def enabled(self):
+        return self.get_bucket() is not None
+
+    def get(self, key):
+        k = Key(self.get_bucket(), key)
+        try:
+            value = k.get_contents_as_string()
+        except S3ResponseError:
+            return (None, None)
+
+        age = time.time() - mktime_tz(parsedate_tz(k.last_modified)) if k.last_modified else None
+        return (value, age)
+
+    def set(self, key, value, content_type='application/json', write_behind=True, age=None):
+        if write_behind:
+            return 'queued' if self.writer.put(self.get_bucket(), key, value, content_type) else 'dropped'
+
+        write_to_s3(self.get_bucket(), key, value, content_type)
+        return 'set'
@@ -3,6 +3,69 @@ import os
 
 class Config(object):
     SENTRY_DSN = os.environ.get('SENTRY_DSN')
+    # Read-only replicas to spread queries across, falling back to
+    # SQLALCHEMY_DATABASE_URI when none are healthy. Downloads, tiles and
+    # spatial lookups use the HEAVY ones instead, if there are any. Replicas
+    # more than REPLICA_MAX_LAG seconds behind are ejected until they catch
+    # up; each is checked every REPLICA_CHECK_INTERVAL seconds.
+    SQLALCHEMY_REPLICA_URIS = []
+    SQLALCHEMY_HEAVY_REPLICA_URIS = []
+    REPLICA_MAX_LAG = 60
+    REPLICA_CHECK_INTERVAL = 10
+    # Evaluate profile indicators with NumPy across all parent levels at once.
+    # Only takes effect if numpy is installed.
+    PROFILE_VECTORIZE = False
+    # Cache rendered profile JSON (bypass with ?nocache=true), optionally
+    # writing it through to S3 as well as memcache.
+    PROFILE_CACHE = True
+    PROFILE_CACHE_S3 = False
+    # Profile tables are joined this many at a time, to stay well clear of
+    # Postgres's limit on the number of columns a query can return.
+    PROFILE_TABLES_PER_QUERY = 20
+    # How many geoids' census_geo_containment parents each worker remembers
+    GEO_CONTAINMENT_CACHE_SIZE = 20000
+    # JSON written by `python -m census_extractomatic.availability`, used to
+    # skip releases without data when serving "latest".
+    AVAILABILITY_MATRIX_PATH = os.environ.get('AVAILABILITY_MATRIX_PATH')
+    # Cache tiers: a per-worker LRU of up to LOCAL_CACHE_BYTES, then memcache,
+    # then files under DISK_CACHE_DIR (if set) up to DISK_CACHE_BYTES, then
+    # S3. TTLs are in seconds; a MEMCACHE_TTL of 0 never expires. The disk
+    # tier is counted, and trimmed if need be, every DISK_CACHE_SCAN_INTERVAL
+    # seconds.
+    LOCAL_CACHE_BYTES = 64 * 1024 * 1024
+    LOCAL_CACHE_TTL = 300
+    MEMCACHE_TTL = 0
+    DISK_CACHE_DIR = None
+    DISK_CACHE_BYTES = 20 * 1024 * 1024 * 1024
+    DISK_CACHE_SCAN_INTERVAL = 300
+    # Cached values older than CACHE_SOFT_TTL seconds are served stale while
+    # they're re-rendered by one of CACHE_REFRESH_THREADS background threads.
+    # Off (0) by default: a release's data doesn't change once it's loaded,
+    # so its cache is dropped with bump_cache instead.
+    CACHE_SOFT_TTL = 0
+    CACHE_REFRESH_THREADS = 4
+    # Each worker thread keeps its memcache connection open between requests
+    MEMCACHE_BINARY = True
+    MEMCACHE_BEHAVIORS = {
+        'tcp_nodelay': True,
+        'ketama': True,
+        'connect_timeout': 500,
+    }
+    # Background S3 uploads per worker; uploads past the queue size are dropped
+    S3_WRITE_WORKERS = 2
+    S3_WRITE_QUEUE_SIZE = 1000
+    # While one worker renders a missed cache key it holds a memcache lease
+    # for up to CACHE_LEASE_TTL seconds; other requests for the key, in that
+    # worker or others, wait up to CACHE_LEASE_WAIT seconds for its result
+    # before rendering it themselves.
+    CACHE_LEASE_TTL = 30
+    CACHE_LEASE_WAIT = 5
+    # Send query counts and db/cache/json time in a Server-Timing header,
+    # and log requests that take longer than SLOW_REQUEST_SECONDS.
+    SERVER_TIMING = True
+    SLOW_REQUEST_SECONDS = 2
+    # /1.0/data/show responses are built up in memory to this size, then on disk
+    RESPONSE_SPOOL_BYTES = 4 * 1024 * 1024
 
 
 class Production(Config):
@@ -12,6 +75,9 @@ class Production(Config):
     JSONIFY_PRETTYPRINT_REGULAR = False
     MAX_GEOIDS_TO_SHOW = 3500
     MAX_GEOIDS_TO_DOWNLOAD = 3500
+    # Keep every release's geoids in memory to validate geoids without the DB
+    GEOID_INDEX = True
+    DISK_CACHE_DIR = '/home/www-data/cache'
 
 
 class Development(Config):
@@ -21,3 +87,6 @@ class Development(Config):
     MEMCACHE_ADDR = ['127.0.0.1']
     ELASTICSEARCH_HOST = ['127.0.0.1:9200']
     JSONIFY_PRETTYPRINT_REGULAR = False
+    # Stands in for S3 when working offline
+    DISK_CACHE_DIR = '/tmp/census-api-cache'
+    DISK_CACHE_BYTES = 2 * 1024 * 1024 * 1024
@@ -1,27 +1,40 @@
-import urlparse
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import os
+import threading
+from sqlalchemy import text
 
-Session = sessionmaker()
+from census_extractomatic.geoid_filter import geoid_filter, pg_array
 
-_sessions = {}
-def session(sql_url):
-    try:
-        return _sessions[sql_url]
-    except KeyError: # probably not super thread-safe, but repeated execution should be harmless
-        engine = create_engine(sql_url)
-        _sessions[sql_url] = Session(bind=engine.connect())
-        return _sessions[sql_url]
+# Each worker thread keeps one OGR connection open for reuse by its downloads
+_ogr_connections = threading.local()
 
-def get_sql_config(sql_url):
+def get_sql_config(url):
     """Return a tuple of strings: (host, user, password, database)"""
-    db_details = urlparse.urlparse(sql_url)
-    return (db_details.hostname,
-            db_details.username,
-            db_details.password,
-            db_details.path[1:])
-
-def create_excel_download(sql_url, data, table_metadata, valid_geo_ids, file_ident, out_filename, format):
+    return (url.host,
+            url.username,
+            url.password,
+            url.database)
+
+def ogr_connection(url, reconnect=False):
+    """Return this thread's OGR PostgreSQL connection to the database at `url`
+    (an engine's SQLAlchemy URL), opening it if there isn't one yet."""
+    import ogr
+    host, user, password, database = get_sql_config(url)
+    conn_string = "PG: host=%s dbname=%s user=%s password=%s" % (host, database, user, password)
+    if url.port:
+        conn_string += " port=%s" % url.port
+
+    conn = getattr(_ogr_connections, 'conn', None)
+    if reconnect or conn is None or _ogr_connections.key != (os.getpid(), conn_string):
+        # Dropping the old data source closes its connection
+        _ogr_connections.conn = None
+        conn = ogr.GetDriverByName("PostgreSQL").Open(conn_string)
+        if conn is None:
+            raise Exception("Could not connect to database to generate download.")
+        _ogr_connections.conn = conn
+        _ogr_connections.key = (os.getpid(), conn_string)
+    return conn
+
+def create_excel_download(engine, data, table_metadata, valid_geo_ids, file_ident, out_filename, format):
     import openpyxl
     wb = openpyxl.workbook.Workbook()
     sheet_name = ', '.join(table_metadata)
@@ -40,19 +53,23 @@ def create_excel_download(sql_url, data, table_metadata, valid_geo_ids, file_ide
 
     # this SQL echoed in OGR export but no geom so copying instead of factoring out
     # plus different binding when using SQLAlchemy
-    result = session(sql_url).execute(
-        """SELECT full_geoid,display_name
-                 FROM tiger2014.census_name_lookup
-                 WHERE full_geoid IN :geoids
-                 ORDER BY full_geoid""",
-        {'geoids': tuple(valid_geo_ids)}
-    )
+    (where, params) = geoid_filter('full_geoid', valid_geo_ids)
+    with engine.connect() as conn:
+        result = conn.execute(text(
+            """SELECT full_geoid,display_name
+                     FROM tiger2014.census_name_lookup
+                     WHERE %s
+                     ORDER BY full_geoid""" % (where,)),
+            **params
+        ).fetchall()
+
     for i, (geoid, name) in enumerate(result):
         row_num = i + 2 # one-indexed, and there's a header
         row_data = [geoid, name]
+        geo_data = data[str(geoid)]
         for (table_id, table) in table_metadata.iteritems():
-            table_estimates = data[geoid][table_id]['estimate']
-            table_errors = data[geoid][table_id]['error']
+            table_estimates = geo_data[table_id]['estimate']
+            table_errors = geo_data[table_id]['error']
             for column_id, column_info in table['columns'].iteritems():
                 row_data.append(table_estimates[column_id])
                 row_data.append(table_errors[column_id])
@@ -61,18 +78,12 @@ def create_excel_download(sql_url, data, table_metadata, valid_geo_ids, file_ide
 
     wb.save(out_filename)
 
-def create_ogr_download(sql_url, data, table_metadata, valid_geo_ids, file_ident, out_filename, format):
+def create_ogr_download(engine, data, table_metadata, valid_geo_ids, file_ident, out_filename, format):
     import ogr
     import osr
     format_info = supported_formats[format]
     driver_name = format_info['driver']
     ogr.UseExceptions()
-    in_driver = ogr.GetDriverByName("PostgreSQL")
-    host, user, password, database = get_sql_config(sql_url)
-    conn = in_driver.Open("PG: host=%s dbname=%s user=%s password=%s" % (host, database, user, password))
-
-    if conn is None:
-        raise Exception("Could not connect to database to generate download.")
 
     out_driver = ogr.GetDriverByName(driver_name)
     out_srs = osr.SpatialReference()
@@ -96,10 +107,24 @@ def create_ogr_download(sql_url, data, table_metadata, valid_geo_ids, file_ident
     # this SQL echoed in Excel export but no geom so copying instead of factoring out
     sql = """SELECT geom,full_geoid,display_name
              FROM tiger2014.census_name_lookup
-             WHERE full_geoid IN (%s)
-             ORDER BY full_geoid""" % ', '.join("'%s'" % g.encode('utf-8') for g in valid_geo_ids)
-    in_layer = conn.ExecuteSQL(sql)
+             WHERE full_geoid = ANY('%s'::varchar[])
+             ORDER BY full_geoid""" % pg_array(valid_geo_ids).encode('utf-8').replace("'", "''")
+    conn = ogr_connection(engine.url)
+    try:
+        in_layer = conn.ExecuteSQL(sql)
+    except RuntimeError:
+        # The kept connection may have been closed under us; try a new one
+        conn = ogr_connection(engine.url, reconnect=True)
+        in_layer = conn.ExecuteSQL(sql)
 
+    try:
+        write_ogr_features(in_layer, out_layer, data, table_metadata, format)
+    finally:
+        conn.ReleaseResultSet(in_layer)
+    out_data.Destroy()
+
+def write_ogr_features(in_layer, out_layer, data, table_metadata, format):
+    import ogr
     in_feat = in_layer.GetNextFeature()
     while in_feat is not None:
         out_feat = ogr.Feature(out_layer.GetLayerDefn())
@@ -108,9 +133,10 @@ def create_ogr_download(sql_url, data, table_metadata, valid_geo_ids, file_ident
         geoid = in_feat.GetField('full_geoid')
         out_feat.SetField('geoid', geoid)
         out_feat.SetField('name', in_feat.GetField('display_name'))
+        geo_data = data[str(geoid)]
         for (table_id, table) in table_metadata.iteritems():
-            table_estimates = data[geoid][table_id]['estimate']
-            table_errors = data[geoid][table_id]['error']
+            table_estimates = geo_data[table_id]['estimate']
+            table_errors = geo_data[table_id]['error']
             for column_id, column_info in table['columns'].iteritems():
                 column_name_utf8 = column_id.encode('utf-8')
                 if column_id in table_estimates:
@@ -128,7 +154,6 @@ def create_ogr_download(sql_url, data, table_metadata, valid_geo_ids, file_ident
         out_layer.CreateFeature(out_feat)
         in_feat.Destroy()
         in_feat = in_layer.GetNextFeature()
-    out_data.Destroy()
 
 supported_formats = { # these should all have a 'function' with the right signature
     'shp':      {"function": create_ogr_download, "driver": "ESRI Shapefile"},
@@ -0,0 +1,32 @@
+"""Filter queries by a list of geoids, bound as a single array parameter.
+
+Binding each geoid separately (`WHERE geoid IN :geoids`) gives every request
+its own SQL text, with one literal per geoid for Postgres to parse and plan.
+Here the list goes over as one array value, so the SQL only changes with the
+shape of the query.
+
+    (where, params) = geoid_filter('full_geoid', geoids)
+    db.session.execute("SELECT ... WHERE %s" % where, params)
+
+"""
+
+# Past this many geoids, match them through a subquery Postgres can hash
+# instead of comparing each row against every element of the array
+UNNEST_THRESHOLD = 500
+
+
+def pg_array(values):
+    "A Postgres array literal ('{...}') holding `values` as strings."
+    return u'{%s}' % u','.join(u'"%s"' % v.replace('\\', '\\\\').replace('"', '\\"') for v in values)
+
+
+def geoid_filter(column, geoids, param='geoids'):
+    """Return `(condition, params)`: SQL matching `column` against `geoids`,
+    and the parameters to execute it with."""
+    geoids = list(geoids)
+    array = 'CAST(:%s AS varchar[])' % param
+    if len(geoids) > UNNEST_THRESHOLD:
+        condition = '%s IN (SELECT unnest(%s))' % (column, array)
+    else:
+        condition = '%s = ANY(%s)' % (column, array)
+    return (condition, {param: pg_array(geoids)})
@@ -0,0 +1,110 @@
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import text
+
+
+class PackedStrings(object):
+    """A sorted list of strings stored end to end in one string, with an
+    array of where each one ends. Supports len() and indexing, which is
+    all bisect needs."""
+
+    def __init__(self, packed, ends):
+        self.packed = packed
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self.ends):
+            raise IndexError(i)
+        start = self.ends[i - 1] if i else 0
+        return self.packed[start:self.ends[i]]
+
+
+class GeoidReleaseIndex(object):
+    """Which releases include which geoids, held in memory so that
+    validating a geoid or picking a release for it doesn't need the DB.
+
+    Geoids are packed, sorted, into a single string that's searched by
+    bisection, next to an array holding a bitmask per geoid: bit N is set
+    if the geoid is in the Nth release. That's a few bytes per geoid on top
+    of the geoid itself, rather than a Python object each.
+    """
+
+    def __init__(self, releases, rows):
+        """Build the index from `rows` of (geoid, release), sorted by geoid
+        byte by byte. A geoid in several releases has a row for each."""
+        self.releases = list(releases)
+        self._bits = dict((release, 1 << i) for i, release in enumerate(self.releases))
+
+        packed = bytearray()
+        ends = array('I')
+        masks = array('L')
+        last = None
+        for (geoid, release) in rows:
+            geoid = str(geoid)
+            if geoid != last:
+                if last is not None and geoid < last:
+                    raise ValueError("Geoids aren't sorted: %s came after %s" % (geoid, last))
+                packed.extend(geoid)
+                ends.append(len(packed))
+                masks.append(0)
+                last = geoid
+            masks[-1] |= self._bits[release]
+
+        self._geoids = PackedStrings(str(packed), ends)
+        self._masks = masks
+
+    @classmethod
+    def load(cls, connection, releases):
+        "Build the index from each release's geoheader table, streaming the rows in one sorted query."
+        sql = ' UNION ALL '.join(
+            "SELECT geoid, %d AS release FROM %s.geoheader" % (i, release)
+            for (i, release) in enumerate(releases)
+        )
+        # Sorted the way Python compares strings, for bisect
+        sql += ' ORDER BY geoid COLLATE "C"'
+
+        result = connection.execution_options(stream_results=True).execute(text(sql))
+        try:
+            return cls(releases, ((row[0], releases[row[1]]) for row in result))
+        finally:
+            result.close()
+
+    def __len__(self):
+        return len(self._geoids)
+
+    def covers(self, release):
+        return release in self._bits
+
+    def _find(self, geoid):
+        "The position of `geoid` in the index, or None."
+        if isinstance(geoid, unicode):
+            try:
+                geoid = geoid.encode('ascii')
+            except UnicodeEncodeError:
+                return None
+        i = bisect_left(self._geoids, geoid)
+        if i < len(self._geoids) and self._geoids[i] == geoid:
+            return i
+        return None
+
+    def get(self, geoid, release):
+        "The geoid as the index has it if `release` includes it, otherwise None."
+        i = self._find(geoid)
+        if i is None or not self._masks[i] & self._bits[release]:
+            return None
+        return self._geoids[i]
+
+    def contains(self, geoid, release):
+        return self.get(geoid, release) is not None
+
+    def releases_for(self, geoid):
+        "The releases that include `geoid`, in the order the index was built with."
+        i = self._find(geoid)
+        if i is None:
+            return []
+        mask = self._masks[i]
+        return [release for release in self.releases if mask & self._bits[release]]
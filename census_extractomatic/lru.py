@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A thread-safe, in-process cache that evicts the least recently used
+    entries to stay within `maxsize` entries and, if given, `maxbytes`
+    (as measured by `sizeof`, which defaults to len()).
+
+    With a `ttl`, entries are also forgotten that many seconds after they
+    were set.
+    """
+
+    def __init__(self, maxsize=None, maxbytes=None, ttl=None, sizeof=len):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.nbytes = 0
+        # key -> (value, size, expires)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                entry = self._data.pop(key)
+            except KeyError:
+                return default
+
+            (value, size, expires) = entry
+            if expires is not None and expires < time.time():
+                self.nbytes -= size
+                return default
+
+            # Re-insert to mark it as the most recently used
+            self._data[key] = entry
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        expires = time.time() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                # Would push everything else out and still not fit
+                return
+
+            self._data[key] = (value, size, expires)
+            self.nbytes += size
+            while ((self.maxsize is not None and len(self._data) > self.maxsize) or
+                   (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+                (_, (_, evicted_size, _)) = self._data.popitem(last=False)
+                self.nbytes -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
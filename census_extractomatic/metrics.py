@@ -0,0 +1,42 @@
+import threading
+
+
+class CacheMetrics(object):
+    """Counts, bytes and time spent on cache operations, broken down by
+    endpoint, cache tier and outcome ('hit', 'miss', 'stale', 'etag', 'set', ...).
+
+    Each worker process keeps its own registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (endpoint, tier, outcome) -> [count, bytes, seconds]
+        self._stats = {}
+
+    def record(self, endpoint, tier, outcome, nbytes=0, seconds=0.0):
+        key = (endpoint, tier, outcome)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = [0, 0, 0.0]
+            stat[0] += 1
+            stat[1] += nbytes
+            stat[2] += seconds
+
+    def snapshot(self):
+        "The numbers so far as {endpoint: {tier: {outcome: {count, bytes, avg_ms}}}}."
+        with self._lock:
+            items = [(key, list(stat)) for (key, stat) in self._stats.items()]
+
+        result = {}
+        for ((endpoint, tier, outcome), (count, nbytes, seconds)) in sorted(items):
+            result.setdefault(endpoint, {}).setdefault(tier, {})[outcome] = {
+                'count': count,
+                'bytes': nbytes,
+                'avg_ms': round(seconds * 1000 / count, 2),
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,56 @@
+import re
+
+from sqlalchemy import text
+
+SCHEMA_RE = re.compile(r'^[a-z]\w*$')
+SELECT_ALL_RE = re.compile(r'\bSELECT\s+(DISTINCT\s+)?(\w+\.)?\*', re.IGNORECASE)
+
+
+class PreparedStatements(object):
+    """Queries that each pooled connection PREPAREs once, then runs by name.
+
+    Statements are registered with a `{schema}` placeholder for the release
+    schema they read from, and Postgres-style `$1`, `$2` parameters whose
+    types Postgres infers:
+
+        statements.register('table_metadata',
+            "SELECT table_id,table_title FROM {schema}.census_table_metadata WHERE table_id=$1")
+        statements.execute(db.session, 'table_metadata', 'acs2014_5yr', 'B01001')
+
+    The first time a connection runs a statement against a schema it
+    PREPAREs it, and notes that in the connection's `info`, which lives as
+    long as the connection does in the pool. Later requests that check out
+    the same connection skip straight to EXECUTE, so Postgres neither parses
+    nor plans the query again.
+
+    Statements name the columns they return. A prepared `SELECT *` fails
+    with "cached plan must not change result type" once its table is
+    reloaded with different columns, on every connection that prepared it.
+    """
+
+    def __init__(self):
+        self._statements = {}
+
+    def register(self, name, sql):
+        if SELECT_ALL_RE.search(sql):
+            raise ValueError("Prepared statements must list their columns: %s" % name)
+        self._statements[name] = sql
+
+    def execute(self, session, name, schema, *args):
+        if not SCHEMA_RE.match(schema):
+            raise ValueError("Not a schema name: %r" % (schema,))
+
+        prepared_name = '%s__%s' % (schema, name)
+        conn = session.connection()
+        prepared = conn.info.setdefault('prepared_statements', set())
+        if prepared_name not in prepared:
+            sql = self._statements[name].format(schema=schema)
+            conn.execute(text('PREPARE %s AS %s' % (prepared_name, sql)))
+            prepared.add(prepared_name)
+
+        if not args:
+            return session.execute('EXECUTE %s' % prepared_name)
+
+        params = dict(('p%d' % i, arg) for (i, arg) in enumerate(args))
+        placeholders = ', '.join(':p%d' % i for i in range(len(args)))
+        return session.execute('EXECUTE %s(%s)' % (prepared_name, placeholders), params)
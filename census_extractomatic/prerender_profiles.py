@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""Render profiles ahead of time so they're already in the cache when traffic arrives.
+
+Run this once after each ACS release is loaded, from the root of the repository:
+
+    python -m census_extractomatic.prerender_profiles --sumlevels 040,050,160 --processes 4 --rate 20
+
+Profiles are written to the same cache keys (and, with --s3, the same S3 bucket) the
+profile endpoints read from. Every geoid that's been handled is appended to the
+--done-file, so an interrupted run picks up where it left off when started again
+with the same file. The file starts with the cache key the profiles went to, and
+once that changes (because a new release is now "latest", or the cache was bumped)
+it's started over rather than skipping profiles that aren't cached any more.
+
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+from census_extractomatic.api import (app, db, allowed_acs, compress_value, find_geoid, geo_profile, make_etag,
+    profile_cache_key, profile_release_key, profile_tiger_release, put_in_cache)
+
+DEFAULT_SUMLEVELS = ['040', '050', '160', '310', '500']
+
+
+def list_geoids(sumlevel):
+    with app.app_context():
+        result = db.session.execute(
+            """SELECT full_geoid
+               FROM %s.census_name_lookup
+               WHERE sumlevel=:sumlevel
+               ORDER BY full_geoid""" % profile_tiger_release,
+            {'sumlevel': sumlevel}
+        )
+        return [row['full_geoid'] for row in result]
+
+
+def render_profile(task):
+    """Render one profile and put it in the cache, the same way the API would.
+
+    Returns (geoid, status, message) with status 'ok', 'missing' (not in any
+    requested release) or 'error'.
+    """
+    (release, geoid, try_s3) = task
+
+    try:
+        with app.test_request_context():
+            app.preprocess_request()
+
+            if release == 'latest':
+                valid_acs, valid_geoid = find_geoid(geoid)
+            else:
+                valid_acs, valid_geoid = find_geoid(geoid, release)
+
+            if not valid_acs:
+                return (geoid, 'missing', None)
+
+            profile = compress_value(geo_profile(release if release == 'latest' else valid_acs, valid_geoid))
+            put_in_cache(profile_cache_key(release, geoid), profile, try_s3=try_s3, write_behind=False,
+                etag=make_etag(profile_release_key(release), profile))
+    except Exception, e:
+        return (geoid, 'error', str(e))
+
+    return (geoid, 'ok', None)
+
+
+def throttle(tasks, rate):
+    "Yield tasks no faster than `rate` per second (all of them right away if rate is 0)."
+    interval = 1.0 / rate if rate else 0
+    next_start = time.time()
+    for task in tasks:
+        delay = next_start - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        next_start = max(next_start, time.time()) + interval
+        yield task
+
+
+def profile_key_pattern(release):
+    "The cache key profiles for `release` are put in, with <geoid> in place of the geoid."
+    with app.test_request_context():
+        app.preprocess_request()
+        return profile_cache_key(release, '<geoid>')
+
+
+def read_done_file(path, key_pattern):
+    """The geoids already rendered to `key_pattern`, or None if the file is
+    from a run that rendered them somewhere else."""
+    if not os.path.exists(path):
+        return set()
+
+    with open(path) as f:
+        if f.readline().strip() != '# %s' % key_pattern:
+            return None
+        return set(line.strip() for line in f if line.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render and cache Census Reporter profiles ahead of time.')
+    parser.add_argument('--release', default='latest', choices=['latest'] + allowed_acs,
+                        help='ACS release to render, or "latest" for the /1.0/latest/ profiles (default: latest)')
+    parser.add_argument('--sumlevels', default=','.join(DEFAULT_SUMLEVELS),
+                        help='Comma-separated summary levels to render (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='Number of worker processes (default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Maximum profiles started per second across all workers, to go easy on Postgres (default: no limit)')
+    parser.add_argument('--done-file',
+                        help='File of geoids already rendered; it is read to resume and appended to as profiles finish (default: prerender_<release>_<sumlevels>.done)')
+    parser.add_argument('--s3', action='store_true', default=app.config.get('PROFILE_CACHE_S3', False),
+                        help='Also write profiles to S3')
+    parser.add_argument('--report-every', type=int, default=100,
+                        help='Print progress after this many profiles (default: %(default)s)')
+    args = parser.parse_args()
+
+    key_pattern = profile_key_pattern(args.release)
+    done_file = args.done_file or 'prerender_%s_%s.done' % (profile_release_key(args.release), args.sumlevels.replace(',', '-'))
+    already_done = read_done_file(done_file, key_pattern)
+    if already_done is None:
+        print "%s was for profiles no longer cached under %s; starting over." % (done_file, key_pattern)
+        already_done = set()
+    if not already_done:
+        with open(done_file, 'w') as done:
+            done.write('# %s\n' % key_pattern)
+
+    geoids = []
+    for sumlevel in args.sumlevels.split(','):
+        sumlevel_geoids = list_geoids(sumlevel)
+        print "Found %d geoids for sumlevel %s" % (len(sumlevel_geoids), sumlevel)
+        geoids.extend(g for g in sumlevel_geoids if g not in already_done)
+
+    print "Rendering %d profiles for %s (%d already done) with %d processes" % (
+        len(geoids), args.release, len(already_done), args.processes)
+
+    # Don't let the workers inherit the connections we just used
+    db.session.remove()
+    db.engine.dispose()
+
+    tasks = throttle(((args.release, geoid, args.s3) for geoid in geoids), args.rate)
+    pool = multiprocessing.Pool(args.processes)
+    counts = {'ok': 0, 'missing': 0, 'error': 0}
+    start = time.time()
+
+    try:
+        with open(done_file, 'a') as done:
+            for i, (geoid, status, message) in enumerate(pool.imap_unordered(render_profile, tasks), 1):
+                counts[status] += 1
+                if status == 'error':
+                    print "Error rendering %s: %s" % (geoid, message)
+                else:
+                    done.write(geoid + '\n')
+                    done.flush()
+
+                if i % args.report_every == 0 or i == len(geoids):
+                    elapsed = time.time() - start
+                    rate = i / elapsed if elapsed else 0
+                    remaining = (len(geoids) - i) / rate if rate else 0
+                    print "%d/%d profiles (%d ok, %d missing, %d errors), %.1f/s, about %d min left" % (
+                        i, len(geoids), counts['ok'], counts['missing'], counts['error'], rate, remaining / 60)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print "Interrupted. Run again with --done-file %s to resume." % done_file
+    pool.join()
+
+
+if __name__ == '__main__':
+    main()
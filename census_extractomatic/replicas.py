@@ -0,0 +1,114 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+logger = logging.getLogger(__name__)
+
+# Seconds a replica is behind its primary, or 0 if it's caught up (or isn't
+# a replica at all)
+LAG_SQL = """SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_xlog_receive_location() = pg_last_xlog_replay_location() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END"""
+
+
+class Replica(object):
+    def __init__(self, uri, engine_options):
+        self.uri = uri
+        self.engine = create_engine(uri, **engine_options)
+        self.healthy = True
+        self.lag = None
+        self.error = None
+
+
+class ReplicaPool(object):
+    """Read-only database replicas that requests are spread across.
+
+    `engine()` hands out the replicas' engines round-robin, skipping any
+    that have been ejected, and returns None when there are none left (or
+    none configured) so the caller can fall back to the primary.
+
+    A background thread checks every replica every `check_interval`
+    seconds, ejecting those that fail the check or are more than `max_lag`
+    seconds behind, and bringing them back once they pass again. Requests
+    can also eject a replica straight away by reporting it `failed`. Like
+    S3WriteBehind, the thread starts on first use in each process.
+    """
+
+    def __init__(self, name, uris, max_lag=30, check_interval=10, engine_options=None):
+        self.name = name
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.replicas = [Replica(uri, engine_options or {}) for uri in uris]
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def engine(self):
+        if not self.replicas:
+            return None
+
+        self._start_checks()
+        with self._lock:
+            for i in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if replica.healthy:
+                    return replica.engine
+        return None
+
+    def failed(self, engine, error=None):
+        "Eject the replica behind `engine` until it passes a health check."
+        for replica in self.replicas:
+            if replica.engine is engine:
+                if replica.healthy:
+                    logger.warning("Ejecting %s replica %s: %s", self.name, replica.engine.url.host, error)
+                replica.healthy = False
+                replica.error = str(error)
+
+    def stats(self):
+        return [{
+            'host': replica.engine.url.host,
+            'healthy': replica.healthy,
+            'lag': replica.lag,
+            'error': replica.error,
+        } for replica in self.replicas]
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as conn:
+                lag = conn.execute(LAG_SQL).scalar()
+        except Exception, e:
+            replica.lag = None
+            self.failed(replica.engine, e)
+            return
+
+        replica.lag = float(lag) if lag is not None else None
+        if replica.lag is not None and replica.lag > self.max_lag:
+            self.failed(replica.engine, "%.0f seconds behind" % replica.lag)
+        elif not replica.healthy:
+            logger.warning("Restoring %s replica %s", self.name, replica.engine.url.host)
+            replica.healthy = True
+            replica.error = None
+
+    def _start_checks(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    for replica in self.replicas:
+                        # Connections inherited across a fork can't be shared
+                        replica.engine.dispose()
+                    thread = threading.Thread(target=self._run, name='%s-replica-checks' % self.name)
+                    thread.daemon = True
+                    thread.start()
+                    self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            for replica in self.replicas:
+                self.check(replica)
+            time.sleep(self.check_interval)
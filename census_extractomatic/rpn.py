@@ -0,0 +1,307 @@
+# For real division instead of sometimes-integer
+from __future__ import division
+
+import math
+import operator
+
+try:
+    import numpy
+except ImportError:
+    # Vectorized evaluation is optional; everything else works without it.
+    numpy = None
+
+
+def percentify(val):
+    return val * 100
+
+
+def rateify(val):
+    return val * 1000
+
+
+def moe_add(moe_a, moe_b):
+    # From http://www.census.gov/acs/www/Downloads/handbooks/ACSGeneralHandbook.pdf
+    return math.sqrt(moe_a**2 + moe_b**2)
+
+
+def moe_ratio(numerator, denominator, numerator_moe, denominator_moe):
+    # From http://www.census.gov/acs/www/Downloads/handbooks/ACSGeneralHandbook.pdf
+    estimated_ratio = numerator / denominator
+    return math.sqrt(numerator_moe**2 + (estimated_ratio**2 * denominator_moe**2)) / denominator
+
+
+ops = {
+    '+': operator.add,
+    '-': operator.sub,
+    '/': operator.div,
+    '%': percentify,
+    '%%': rateify,
+}
+moe_ops = {
+    '+': moe_add,
+    '-': moe_add,
+    '/': moe_ratio,
+    '%': percentify,
+    '%%': rateify,
+}
+
+# Step kinds in a compiled expression
+PUSH_COLUMN = 0
+PUSH_CONSTANT = 1
+UNARY_OP = 2
+BINARY_OP = 3
+DIVIDE = 4
+
+EMPTY_RESULT = (None, None, None, None)
+
+
+class RPNExpression(object):
+    """An RPN string like 'b01001002 b01001001 / %' tokenized once into a
+    list of steps that can be evaluated against any number of geographies.
+
+    Evaluation gives the same (value, error, numerator, numerator_moe)
+    tuple the old token-by-token interpreter did.
+    """
+
+    def __init__(self, rpn_string):
+        self.rpn_string = rpn_string
+        self.columns = []
+
+        steps = []
+        depth = 0
+        for token in rpn_string.split():
+            if token in ('%', '%%'):
+                # Single-argument operators
+                steps.append((UNARY_OP, ops[token], moe_ops[token]))
+                consumed = 1
+            elif token == '/':
+                steps.append((DIVIDE, None, None))
+                consumed = 2
+            elif token in ops:
+                steps.append((BINARY_OP, ops[token], moe_ops[token]))
+                consumed = 2
+            elif token.startswith('b'):
+                steps.append((PUSH_COLUMN, token, token + '_moe'))
+                if token not in self.columns:
+                    self.columns.append(token)
+                consumed = 0
+            else:
+                steps.append((PUSH_CONSTANT, float(token), float(token)))
+                consumed = 0
+
+            if depth < consumed:
+                raise ValueError("Not enough operands for '%s' in RPN '%s'" % (token, rpn_string))
+            depth = depth - consumed + 1
+
+        if not steps:
+            raise ValueError("Empty RPN expression")
+
+        self.steps = tuple(steps)
+
+    def __repr__(self):
+        return 'RPNExpression(%r)' % self.rpn_string
+
+    def evaluate(self, data):
+        stack = []
+        moe_stack = []
+        numerator = None
+        numerator_moe = None
+
+        for (kind, arg, moe_arg) in self.steps:
+            if kind == PUSH_COLUMN:
+                c = data[arg]
+                c_moe = data[moe_arg]
+            elif kind == PUSH_CONSTANT:
+                c = arg
+                c_moe = moe_arg
+            elif kind == UNARY_OP:
+                b = stack.pop()
+                b_moe = moe_stack.pop()
+                if b is None:
+                    c = None
+                    c_moe = None
+                else:
+                    c = arg(b)
+                    c_moe = moe_arg(b_moe)
+            else:
+                b = stack.pop()
+                b_moe = moe_stack.pop()
+                a = stack.pop()
+                a_moe = moe_stack.pop()
+
+                if a is None or b is None:
+                    c = None
+                    c_moe = None
+                elif kind == DIVIDE:
+                    # We're dealing with ratios, not pure division.
+                    if a == 0 or b == 0:
+                        c = 0
+                        c_moe = 0
+                    else:
+                        c = operator.div(a, b)
+                        c_moe = moe_ratio(a, b, a_moe, b_moe)
+                    numerator = a
+                    numerator_moe = round(a_moe, 1)
+                else:
+                    c = arg(a, b)
+                    c_moe = moe_arg(a_moe, b_moe)
+            stack.append(c)
+            moe_stack.append(c_moe)
+
+        return (stack.pop(), moe_stack.pop(), numerator, numerator_moe)
+
+    def evaluate_many(self, data, geoids):
+        """Evaluate for each geoid in `geoids`, pulling rows from the
+        `data` dict of geoid -> row. Geoids without a row give all Nones."""
+        evaluate = self.evaluate
+        results = []
+        for geoid in geoids:
+            data_for_geoid = data.get(geoid) if data else None
+            if data_for_geoid:
+                results.append(evaluate(data_for_geoid))
+            else:
+                results.append(EMPTY_RESULT)
+        return results
+
+    def evaluate_arrays(self, columns):
+        """Evaluate for every geography in a ColumnArrays at once.
+
+        Returns (value, error, numerator, numerator_moe) float arrays with
+        NaN wherever evaluate() would have given None.
+        """
+        nan = numpy.nan
+        size = columns.size
+        stack = []
+        moe_stack = []
+        numerator = numpy.full(size, nan)
+        numerator_moe = numpy.full(size, nan)
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            for (kind, arg, moe_arg) in self.steps:
+                if kind == PUSH_COLUMN:
+                    c = columns.column(arg)
+                    c_moe = columns.column(moe_arg)
+                elif kind == PUSH_CONSTANT:
+                    c = numpy.full(size, arg)
+                    c_moe = numpy.full(size, moe_arg)
+                elif kind == UNARY_OP:
+                    b = stack.pop()
+                    b_moe = moe_stack.pop()
+                    c = arg(b)
+                    c_moe = numpy.where(numpy.isnan(b), nan, moe_arg(b_moe))
+                else:
+                    b = stack.pop()
+                    b_moe = moe_stack.pop()
+                    a = stack.pop()
+                    a_moe = moe_stack.pop()
+                    null = numpy.isnan(a) | numpy.isnan(b)
+
+                    if kind == DIVIDE:
+                        # We're dealing with ratios, not pure division.
+                        zero = (a == 0) | (b == 0)
+                        ratio = a / b
+                        ratio_moe = numpy.sqrt(a_moe**2 + (ratio**2 * b_moe**2)) / b
+                        c = numpy.where(null, nan, numpy.where(zero, 0.0, ratio))
+                        c_moe = numpy.where(null, nan, numpy.where(zero, 0.0, ratio_moe))
+                        numerator = numpy.where(null, numerator, a)
+                        numerator_moe = numpy.where(null, numerator_moe, round_half_away(a_moe, 1))
+                    else:
+                        c = arg(a, b)
+                        c_moe = numpy.where(null, nan, numpy.sqrt(a_moe**2 + b_moe**2))
+                stack.append(c)
+                moe_stack.append(c_moe)
+
+        missing = ~columns.present
+        results = []
+        for array in (stack.pop(), moe_stack.pop(), numerator, numerator_moe):
+            array = numpy.array(array, dtype=float)
+            array[missing] = nan
+            results.append(array)
+
+        return tuple(results)
+
+    def evaluate_vectorized(self, data, geoids, decimals=2):
+        """Vectorized counterpart to evaluate_many that also does the
+        rounding build_item does, giving a list of rounded
+        (value, error, numerator, numerator_moe) tuples with None for nulls.
+
+        `data` may be a dict of geoid -> row or an already built
+        ColumnArrays for the same `geoids`, which lets a profile pack its
+        columns once and reuse them across all of its indicators.
+        """
+        if isinstance(data, ColumnArrays):
+            columns = data
+        else:
+            columns = ColumnArrays(data, geoids)
+
+        (value, error, numerator, numerator_moe) = self.evaluate_arrays(columns)
+        value = round_half_away(value, decimals)
+        error = numpy.where(numpy.isnan(value), numpy.nan, round_half_away(error, decimals))
+        numerator = round_half_away(numerator, decimals)
+        numerator_moe = numpy.where(numpy.isnan(numerator), numpy.nan, round_half_away(numerator_moe, decimals))
+
+        return zip(
+            nan_to_none(value),
+            nan_to_none(error),
+            nan_to_none(numerator),
+            nan_to_none(numerator_moe)
+        )
+
+
+class ColumnArrays(dict):
+    """A geoid -> row dict whose columns are also packed into float
+    arrays, one slot per geoid in `geoids`. Nulls and missing rows become
+    NaN. Arrays are built the first time a column is asked for and then
+    reused.
+
+    It can stand in for the dict it was built from, so code that reads
+    rows by geoid doesn't need to know it's been packed.
+    """
+
+    def __init__(self, data, geoids):
+        dict.__init__(self, data or {})
+        rows = [self.get(geoid) for geoid in geoids]
+        self.geoids = list(geoids)
+        self.size = len(rows)
+        self.present = numpy.array([bool(row) for row in rows], dtype=bool)
+        self._rows = [row or {} for row in rows]
+        self._arrays = {}
+
+    def column(self, column):
+        try:
+            return self._arrays[column]
+        except KeyError:
+            array = numpy.array([row.get(column) for row in self._rows], dtype=float)
+            self._arrays[column] = array
+            return array
+
+
+def round_half_away(array, decimals):
+    "Round like Python 2's round(): halves go away from zero."
+    scale = 10 ** decimals
+    with numpy.errstate(invalid='ignore'):
+        return numpy.sign(array) * numpy.floor(numpy.abs(array) * scale + 0.5) / scale
+
+
+def nan_to_none(array):
+    return [None if numpy.isnan(v) else float(v) for v in array]
+
+
+_compiled = {}
+
+
+def compile_rpn(rpn_string):
+    "Return the (shared) compiled RPNExpression for an RPN string."
+    if isinstance(rpn_string, RPNExpression):
+        return rpn_string
+
+    try:
+        return _compiled[rpn_string]
+    except KeyError:
+        expression = RPNExpression(rpn_string)
+        _compiled[rpn_string] = expression
+        return expression
+
+
+def value_rpn_calc(data, rpn_string):
+    return compile_rpn(rpn_string).evaluate(data)
@@ -0,0 +1,86 @@
+import logging
+import os
+import threading
+import Queue
+
+from boto.s3.key import Key
+
+logger = logging.getLogger(__name__)
+
+
+class S3WriteBehind(object):
+    """Uploads cache values to S3 from background threads so a request never
+    waits on one.
+
+    At most `max_queue` uploads wait at a time; past that, new ones are
+    dropped and counted rather than blocking the request. The threads start
+    on first use in each process, so a copy inherited across a fork starts
+    its own instead of relying on threads that didn't survive it.
+    """
+
+    def __init__(self, workers=2, max_queue=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.counts = {'queued': 0, 'written': 0, 'failed': 0, 'dropped': 0}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def put(self, bucket, cache_key, value, content_type='application/json'):
+        "Queue an upload, returning False if it had to be dropped."
+        queue = self._get_queue()
+        try:
+            queue.put_nowait((bucket, cache_key, value, content_type))
+        except Queue.Full:
+            self._count('dropped')
+            return False
+
+        self._count('queued')
+        return True
+
+    def join(self):
+        "Wait for every queued upload to finish."
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats['pending'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _get_queue(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = Queue.Queue(self.max_queue)
+                    for i in range(self.workers):
+                        thread = threading.Thread(target=self._run, args=(self._queue,), name='s3-write-behind-%d' % i)
+                        thread.daemon = True
+                        thread.start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def _run(self, queue):
+        while True:
+            (bucket, cache_key, value, content_type) = queue.get()
+            try:
+                write_to_s3(bucket, cache_key, value, content_type)
+                self._count('written')
+            except Exception, e:
+                self._count('failed')
+                logger.warning("S3 upload of %s failed: %s", cache_key, e)
+            finally:
+                queue.task_done()
+
+
+def write_to_s3(bucket, cache_key, value, content_type='application/json'):
+    k = Key(bucket, cache_key)
+    k.metadata['Content-Type'] = content_type
+    if value[:2] == '\x1f\x8b':
+        k.metadata['Content-Encoding'] = 'gzip'
+    k.set_contents_from_string(value, reduced_redundancy=True, policy='public-read')
@@ -0,0 +1,55 @@
+import sys
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Lets concurrent callers asking for the same key share one call.
+
+    The first caller for a key runs the function; anyone else asking for
+    that key while it runs waits and gets the same result, or the same
+    exception, instead of running it again. With a `timeout`, a caller
+    that has waited that many seconds gives up and runs it itself.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _waiting(self, key):
+        "Called just before a caller starts waiting on someone else's call for `key`."
+        pass
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            self._waiting(key)
+            if not call.done.wait(self.timeout):
+                return fn()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
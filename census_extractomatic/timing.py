@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestTimings(object):
+    """Where one request's time went: the number of queries it ran, the
+    time spent in them and the slowest one, plus named spans such as
+    'cache' and 'json'."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.queries = 0
+        self.db = 0.0
+        self.slowest = (0.0, None)
+        self.spans = {}
+
+    def add_query(self, statement, seconds):
+        self.queries += 1
+        self.db += seconds
+        if seconds > self.slowest[0]:
+            self.slowest = (seconds, statement)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def server_timing(self):
+        "The timings as a Server-Timing header value, in milliseconds."
+        parts = ['db;desc="%d queries";dur=%.1f' % (self.queries, self.db * 1000)]
+        for name in sorted(self.spans):
+            parts.append('%s;dur=%.1f' % (name, self.spans[name] * 1000))
+        parts.append('total;dur=%.1f' % (self.elapsed() * 1000))
+        return ', '.join(parts)
+
+
+def current_timings():
+    "The current request's RequestTimings, or None outside of one."
+    if not has_app_context():
+        return None
+    return getattr(g, 'timings', None)
+
+
+@contextmanager
+def timed(name):
+    "Add the time spent in the block to the current request's `name` span."
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings = current_timings()
+        if timings is not None:
+            timings.add(name, time.time() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = current_timings()
+    if timings is not None:
+        timings.add_query(statement, time.time() - context._query_start)
+
+
+def track_queries(engine_class=Engine):
+    "Count every query run through SQLAlchemy against the request it's for."
+    if not event.contains(engine_class, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine_class, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine_class, 'after_cursor_execute', _after_cursor_execute)
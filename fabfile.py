@@ -138,10 +138,18 @@ def install_packages():
     _install_nginx()
 
 def flushcache():
-    "Flush the memcache by restarting it."
+    "Flush the memcache by restarting it. This drops every release's cache; prefer bumpcache."
 
     sudo('service memcached restart')
 
+def bumpcache(*releases):
+    """ Invalidate the cache for the given releases only, e.g. `fab bumpcache:acs2015_1yr,tiger2014`. """
+
+    with cd(code_dir):
+        with prefix('source %s/bin/activate' % virtualenv_dir):
+            with shell_env(EXTRACTOMATIC_CONFIG_MODULE='census_extractomatic.config.Production'):
+                sudo('python -m census_extractomatic.bump_cache %s' % ' '.join(releases), user='www-data')
+
 def initial_config():
     """ Configure the remote host to run Census Reporter API. """
 
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from census_extractomatic.cache_backends import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        # No background thread; the tests call evict themselves
+        self.cache = DiskCache(self.root, 1000, scan_interval=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read_at(self, key, atime):
+        path = self.cache.path(key)
+        os.utime(path, (atime, os.stat(path).st_mtime))
+
+    def test_round_trip(self):
+        self.assertEqual(self.cache.get('missing'), (None, None))
+        self.assertEqual(self.cache.set('profile/16000US1714000', 'x' * 10), 'set')
+        (value, age) = self.cache.get('profile/16000US1714000')
+        self.assertEqual(value, 'x' * 10)
+        self.assertTrue(0 <= age < 5)
+
+    def test_keeps_age_of_copied_values(self):
+        self.cache.set('key', 'value', age=3600)
+        (value, age) = self.cache.get('key')
+        self.assertTrue(3600 <= age < 3605)
+
+    def test_reads_bump_atime_at_most_every_touch_interval(self):
+        self.cache.set('key', 'value')
+        now = time.time()
+        touched = []
+        utime = os.utime
+
+        def record_utime(path, times):
+            touched.append(times[0])
+            utime(path, times)
+
+        os.utime = record_utime
+        try:
+            self.read_at('key', now - 30)
+            del touched[:]
+            self.cache.get('key')
+            self.assertEqual(touched, [])
+
+            self.read_at('key', now - 120)
+            del touched[:]
+            self.cache.get('key')
+            self.assertEqual(len(touched), 1)
+            self.assertTrue(touched[0] >= now)
+        finally:
+            os.utime = utime
+
+    def test_evicts_least_recently_read_by_bytes(self):
+        now = time.time()
+        for i in range(5):
+            self.cache.set('key%d' % i, 'x' * 300)
+            self.read_at('key%d' % i, now - 100 + i)
+        # key3 was read longest ago, then key0
+        self.read_at('key3', now - 200)
+
+        self.cache.evict()
+        kept = [i for i in range(5) if self.cache.get('key%d' % i)[0]]
+        self.assertEqual(kept, [1, 2, 4])
+        self.assertEqual(self.cache._nbytes, 900)
+
+    def test_under_the_limit_is_left_alone(self):
+        for i in range(3):
+            self.cache.set('key%d' % i, 'x' * 300)
+        self.cache.evict()
+        self.assertEqual(self.cache._nbytes, 900)
+        self.assertTrue(all(self.cache.get('key%d' % i)[0] for i in range(3)))
+
+    def test_counts_other_writers(self):
+        other = DiskCache(self.root, 1000, scan_interval=0)
+        other.set('theirs', 'x' * 800)
+        self.cache.set('mine', 'x' * 300)
+        self.read_at('theirs', time.time() - 100)
+
+        self.cache.evict()
+        self.assertIsNone(self.cache.get('theirs')[0])
+        self.assertEqual(self.cache.get('mine')[0], 'x' * 300)
+
+    def test_writes_wake_eviction_when_over(self):
+        self.cache.evict()
+        self.assertFalse(self.cache._wake.is_set())
+        self.cache.set('key', 'x' * 1200)
+        self.assertTrue(self.cache._wake.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from census_extractomatic.geoid_filter import geoid_filter, pg_array, UNNEST_THRESHOLD
+
+
+class PgArrayTest(unittest.TestCase):
+    def test_literal(self):
+        self.assertEqual(pg_array(['04000US17', '01000US']), u'{"04000US17","01000US"}')
+        self.assertEqual(pg_array([]), u'{}')
+
+    def test_escaping(self):
+        self.assertEqual(pg_array(['a"b', 'c\\d', 'e,f']), u'{"a\\"b","c\\\\d","e,f"}')
+
+
+class GeoidFilterTest(unittest.TestCase):
+    def test_any(self):
+        (condition, params) = geoid_filter('geoid', ['04000US17', '16000US1714000'])
+        self.assertEqual(condition, 'geoid = ANY(CAST(:geoids AS varchar[]))')
+        self.assertEqual(params, {'geoids': u'{"04000US17","16000US1714000"}'})
+
+    def test_param_name(self):
+        (condition, params) = geoid_filter('child.full_geoid', iter(['04000US17']), param='parents')
+        self.assertEqual(condition, 'child.full_geoid = ANY(CAST(:parents AS varchar[]))')
+        self.assertEqual(params, {'parents': u'{"04000US17"}'})
+
+    def test_same_sql_for_any_number_of_geoids(self):
+        self.assertEqual(geoid_filter('geoid', ['01000US'])[0], geoid_filter('geoid', ['01000US'] * UNNEST_THRESHOLD)[0])
+
+    def test_unnest_past_threshold(self):
+        geoids = ['14000US%011d' % i for i in range(UNNEST_THRESHOLD + 1)]
+        (condition, params) = geoid_filter('geoid', geoids)
+        self.assertEqual(condition, 'geoid IN (SELECT unnest(CAST(:geoids AS varchar[])))')
+        self.assertEqual(params['geoids'], pg_array(geoids))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from census_extractomatic.geoid_index import GeoidReleaseIndex
+
+RELEASES = ['acs2015_1yr', 'acs2014_5yr', 'acs2014_1yr']
+
+
+class GeoidReleaseIndexTest(unittest.TestCase):
+    def setUp(self):
+        rows = [
+            ('01000US', 'acs2015_1yr'),
+            ('01000US', 'acs2014_5yr'),
+            ('01000US', 'acs2014_1yr'),
+            ('04000US17', 'acs2015_1yr'),
+            ('04000US17', 'acs2014_5yr'),
+            ('14000US17031010100', 'acs2014_5yr'),
+            ('16000US1714000', 'acs2014_1yr'),
+        ]
+        self.index = GeoidReleaseIndex(RELEASES, rows)
+
+    def test_releases_for(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.releases_for('01000US'), RELEASES)
+        self.assertEqual(self.index.releases_for('14000US17031010100'), ['acs2014_5yr'])
+        self.assertEqual(self.index.releases_for('04000US18'), [])
+
+    def test_get_returns_the_stored_geoid(self):
+        geoid = self.index.get(u'04000US17', 'acs2014_5yr')
+        self.assertEqual(geoid, '04000US17')
+        self.assertIsInstance(geoid, str)
+        self.assertIsNone(self.index.get('04000US17', 'acs2014_1yr'))
+        self.assertIsNone(self.index.get(u'04000US\xe9', 'acs2014_1yr'))
+
+    def test_contains(self):
+        self.assertTrue(self.index.contains('16000US1714000', 'acs2014_1yr'))
+        self.assertFalse(self.index.contains('16000US1714000', 'acs2015_1yr'))
+        # Prefixes of stored geoids aren't in it
+        self.assertFalse(self.index.contains('04000US1', 'acs2015_1yr'))
+        self.assertFalse(self.index.contains('', 'acs2015_1yr'))
+        self.assertFalse(self.index.contains('99999US', 'acs2015_1yr'))
+
+    def test_unsorted_rows(self):
+        self.assertRaises(ValueError, GeoidReleaseIndex, RELEASES, [('04000US17', 'acs2015_1yr'), ('01000US', 'acs2015_1yr')])
+
+
+if __name__ == '__main__':
+    unittest.main()
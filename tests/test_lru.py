@@ -0,0 +1,49 @@
+import unittest
+
+from census_extractomatic.lru import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = LRUCache(maxbytes=10)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        self.assertEqual(cache.get('a'), 'xxxx')
+        cache.set('c', 'xxxx')
+
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 'xxxx')
+        self.assertEqual(cache.get('c'), 'xxxx')
+        self.assertEqual(cache.nbytes, 8)
+
+    def test_replacing_a_value_updates_its_size(self):
+        cache = LRUCache(maxbytes=10)
+        cache.set('a', 'xxxxxx')
+        cache.set('a', 'xx')
+        self.assertEqual(cache.nbytes, 2)
+        cache.delete('a')
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_too_big_to_fit(self):
+        cache = LRUCache(maxbytes=10)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'x' * 11)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 'xxxx')
+
+    def test_maxsize(self):
+        cache = LRUCache(maxsize=2)
+        for key in 'abc':
+            cache.set(key, key)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('a'))
+
+    def test_ttl(self):
+        cache = LRUCache(maxbytes=10, ttl=-1)
+        cache.set('a', 'xxxx')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.nbytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
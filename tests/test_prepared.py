@@ -0,0 +1,80 @@
+import unittest
+
+from census_extractomatic.prepared import PreparedStatements
+
+
+class FakeConnection(object):
+    def __init__(self, log):
+        self.info = {}
+        self.log = log
+
+    def execute(self, sql):
+        self.log.append(str(sql))
+
+
+class FakeSession(object):
+    "Records what's run, on one connection that stays checked out like a pooled one."
+
+    def __init__(self):
+        self.log = []
+        self.conn = FakeConnection(self.log)
+
+    def connection(self):
+        return self.conn
+
+    def execute(self, sql, params=None):
+        self.log.append((sql, params))
+
+
+class PreparedStatementsTest(unittest.TestCase):
+    def setUp(self):
+        self.statements = PreparedStatements()
+        self.statements.register('table_metadata',
+            "SELECT table_id,table_title FROM {schema}.census_table_metadata WHERE table_id=$1")
+        self.statements.register('all_tables',
+            "SELECT table_id FROM {schema}.census_table_metadata")
+        self.session = FakeSession()
+
+    def test_prepares_once_per_connection(self):
+        self.statements.execute(self.session, 'table_metadata', 'acs2014_5yr', 'B01001')
+        self.statements.execute(self.session, 'table_metadata', 'acs2014_5yr', 'B01002')
+        self.assertEqual(self.session.log, [
+            'PREPARE acs2014_5yr__table_metadata AS SELECT table_id,table_title FROM acs2014_5yr.census_table_metadata WHERE table_id=$1',
+            ('EXECUTE acs2014_5yr__table_metadata(:p0)', {'p0': 'B01001'}),
+            ('EXECUTE acs2014_5yr__table_metadata(:p0)', {'p0': 'B01002'}),
+        ])
+
+    def test_each_schema_is_prepared(self):
+        self.statements.execute(self.session, 'table_metadata', 'acs2014_5yr', 'B01001')
+        self.statements.execute(self.session, 'table_metadata', 'acs2015_1yr', 'B01001')
+        prepares = [entry for entry in self.session.log if isinstance(entry, str)]
+        self.assertEqual(len(prepares), 2)
+        self.assertEqual(self.session.conn.info['prepared_statements'],
+                         set(['acs2014_5yr__table_metadata', 'acs2015_1yr__table_metadata']))
+
+    def test_new_connection_prepares_again(self):
+        self.statements.execute(self.session, 'table_metadata', 'acs2014_5yr', 'B01001')
+        self.session.conn = FakeConnection(self.session.log)
+        self.statements.execute(self.session, 'table_metadata', 'acs2014_5yr', 'B01001')
+        prepares = [entry for entry in self.session.log if isinstance(entry, str)]
+        self.assertEqual(len(prepares), 2)
+
+    def test_no_arguments(self):
+        self.statements.execute(self.session, 'all_tables', 'acs2014_5yr')
+        self.assertEqual(self.session.log[-1], ('EXECUTE acs2014_5yr__all_tables', None))
+
+    def test_rejects_select_all(self):
+        # A prepared SELECT * breaks when its table is reloaded with other columns
+        self.assertRaises(ValueError, self.statements.register, 'geoheader',
+                          "SELECT * FROM {schema}.geoheader WHERE geoid=$1")
+        self.assertRaises(ValueError, self.statements.register, 'geoheader',
+                          "select g.* FROM {schema}.geoheader g WHERE geoid=$1")
+        self.statements.register('count', "SELECT count(*) FROM {schema}.geoheader")
+
+    def test_rejects_schema_names_that_arent(self):
+        self.assertRaises(ValueError, self.statements.execute, self.session, 'all_tables', 'acs; DROP TABLE x')
+        self.assertEqual(self.session.log, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import re
+import unittest
+
+from census_extractomatic import api
+
+
+class FakeResult(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+class FakeSession(object):
+    """Answers get_profile_data's queries from `tables`, {release: {table_id:
+    {geoid: first estimate}}}, the way Postgres would: a row for every geoid
+    asked for, with nulls for the tables that don't have it."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = []
+
+    def execute(self, sql, params):
+        self.queries.append(sql)
+        geoids = [geoid.strip('"') for geoid in params['geoids'][1:-1].split(',')]
+        rows = []
+        for geoid in geoids:
+            row = {'geoid': geoid}
+            for (release, table_id) in re.findall(r'LEFT JOIN (\w+)\.(\w+)_moe', sql):
+                value = self.tables[release].get(table_id, {}).get(geoid)
+                row['%s001' % table_id.lower()] = value
+                row['%s001_moe' % table_id.lower()] = None if value is None else 1.0
+            rows.append(row)
+        return FakeResult(rows)
+
+
+class GetProfileDataTest(unittest.TestCase):
+    geoids = ['04000US17', '16000US1714000']
+
+    def setUp(self):
+        self.session = api.db.session
+        self.per_query = api.app.config['PROFILE_TABLES_PER_QUERY']
+        self.context = api.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        api.db.session = self.session
+        api.app.config['PROFILE_TABLES_PER_QUERY'] = self.per_query
+        self.context.pop()
+
+    def fake(self, tables):
+        api.db.session = FakeSession(tables)
+        return api.db.session
+
+    def test_table_missing_a_geoid(self):
+        self.fake({
+            'acs2014_5yr': {
+                'B01001': {'04000US17': 100.0, '16000US1714000': 50.0},
+                'B19013': {'04000US17': 60000.0},
+            },
+        })
+        results = api.get_profile_data(['B01001', 'B19013'], self.geoids, 'acs2014_5yr')
+
+        (data, acs) = results['B01001']
+        self.assertEqual(acs, 'acs2014_5yr')
+        self.assertEqual(data['16000US1714000']['b01001001'], 50.0)
+        self.assertEqual(data['16000US1714000']['b19013001'], None)
+        self.assertEqual(data['04000US17']['b19013001'], 60000.0)
+
+    def test_group_missing_a_geoid_falls_back(self):
+        self.fake({
+            'acs2015_1yr': {
+                'B01001': {'04000US17': 100.0, '16000US1714000': 50.0},
+                'B19013': {'04000US17': 60000.0},
+            },
+            'acs2014_5yr': {
+                'B19013': {'04000US17': 58000.0, '16000US1714000': 45000.0},
+            },
+        })
+        results = api.get_profile_data(['B01001', 'B19013'], self.geoids)
+
+        self.assertEqual(results['B01001'][1], 'acs2015_1yr')
+        self.assertEqual(results['B01001'][0]['16000US1714000']['b01001001'], 50.0)
+        self.assertEqual(results['B19013'][1], 'acs2014_5yr')
+        self.assertEqual(results['B19013'][0]['16000US1714000']['b19013001'], 45000.0)
+
+    def test_tables_split_across_queries(self):
+        session = self.fake({
+            'acs2014_5yr': {
+                'B01001': {'04000US17': 100.0, '16000US1714000': 50.0},
+                'B19013': {'04000US17': 60000.0, '16000US1714000': 45000.0},
+                'B25077': {'04000US17': 180000.0, '16000US1714000': 250000.0},
+            },
+        })
+        api.app.config['PROFILE_TABLES_PER_QUERY'] = 2
+        results = api.get_profile_data(['B01001', ('B19013', 'B25077')], self.geoids, 'acs2014_5yr')
+
+        self.assertEqual(len(session.queries), 2)
+        data = results[('B19013', 'B25077')][0]
+        self.assertEqual(data['16000US1714000']['b01001001'], 50.0)
+        self.assertEqual(data['16000US1714000']['b25077001'], 250000.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+
+from census_extractomatic.replicas import ReplicaPool
+
+
+class FakeResult(object):
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection(object):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        return FakeResult(self.engine.lag)
+
+
+class FakeEngine(object):
+    "Stands in for a replica's engine, reporting `lag` or failing to connect."
+
+    def __init__(self, host):
+        self.url = type('URL', (), {'host': host})()
+        self.lag = 0
+        self.down = False
+
+    def connect(self):
+        if self.down:
+            raise Exception("could not connect to %s" % self.url.host)
+        return FakeConnection(self)
+
+
+class ReplicaPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ReplicaPool('test', ['sqlite://', 'sqlite://'], max_lag=30)
+        for (i, replica) in enumerate(self.pool.replicas):
+            replica.engine = FakeEngine('replica%d' % i)
+        # Don't start the background checks; the tests run them by hand
+        self.pool._pid = os.getpid()
+        (self.first, self.second) = [replica.engine for replica in self.pool.replicas]
+
+    def test_round_robin(self):
+        engines = [self.pool.engine() for i in range(4)]
+        self.assertEqual(engines, [self.first, self.second, self.first, self.second])
+
+    def test_no_replicas(self):
+        self.assertIsNone(ReplicaPool('empty', []).engine())
+
+    def test_failed_replica_is_skipped(self):
+        self.pool.failed(self.first, "connection reset")
+        self.assertEqual([self.pool.engine() for i in range(3)], [self.second] * 3)
+        self.assertEqual(self.pool.stats()[0]['error'], "connection reset")
+
+    def test_all_failed(self):
+        self.pool.failed(self.first)
+        self.pool.failed(self.second)
+        self.assertIsNone(self.pool.engine())
+
+    def test_check_ejects_unreachable_and_restores(self):
+        self.first.down = True
+        self.pool.check(self.pool.replicas[0])
+        self.assertFalse(self.pool.replicas[0].healthy)
+        self.assertIsNone(self.pool.replicas[0].lag)
+
+        self.first.down = False
+        self.pool.check(self.pool.replicas[0])
+        self.assertTrue(self.pool.replicas[0].healthy)
+        self.assertIsNone(self.pool.replicas[0].error)
+        self.assertIn(self.first, [self.pool.engine() for i in range(2)])
+
+    def test_check_ejects_lagging(self):
+        self.second.lag = 120
+        self.pool.check(self.pool.replicas[1])
+        self.assertFalse(self.pool.replicas[1].healthy)
+        self.assertEqual(self.pool.replicas[1].lag, 120.0)
+
+        self.second.lag = 5
+        self.pool.check(self.pool.replicas[1])
+        self.assertTrue(self.pool.replicas[1].healthy)
+
+    def test_engine_options(self):
+        pool = ReplicaPool('options', ['sqlite://'], engine_options={'echo': True})
+        self.assertTrue(pool.replicas[0].engine.echo)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import random
+import unittest
+
+from census_extractomatic import rpn
+from census_extractomatic.rpn import compile_rpn, value_rpn_calc
+
+EXPRESSIONS = [
+    'b01001003 b01001004 + b01001005 + b01001006 + b01001027 + b01001028 + b01001029 + b01001030 + b01001001 / %',
+    'b19301001',
+    'b17001002 b17001001 / %',
+    'b25002003 b25002001 / %',
+    'b08006002 b08006001 - b08006001 / %%',
+    'b15002015 b15002016 + b15002017 + b15002018 + 100 /',
+]
+
+
+def round_result(value, error, numerator, numerator_moe):
+    "The rounding build_item does on the scalar path."
+    if value is not None:
+        value = round(value, 2)
+        error = round(error, 2)
+    if numerator is not None:
+        numerator = round(numerator, 2)
+        numerator_moe = round(numerator_moe, 2)
+    return (value, error, numerator, numerator_moe)
+
+
+class RPNTest(unittest.TestCase):
+    def test_evaluate(self):
+        data = {'b01001001': 200.0, 'b01001001_moe': 10.0, 'b01001002': 50.0, 'b01001002_moe': 5.0}
+        (value, error, numerator, numerator_moe) = value_rpn_calc(data, 'b01001002 b01001001 / %')
+        self.assertEqual(value, 25.0)
+        self.assertAlmostEqual(error, 2.7950849718747373)
+        self.assertEqual((numerator, numerator_moe), (50.0, 5.0))
+
+    def test_ratio_of_zero(self):
+        data = {'b01001001': 0.0, 'b01001001_moe': 10.0, 'b01001002': 50.0, 'b01001002_moe': 5.0}
+        self.assertEqual(value_rpn_calc(data, 'b01001002 b01001001 /'), (0, 0, 50.0, 5.0))
+
+    def test_nulls(self):
+        data = {'b01001001': None, 'b01001001_moe': None, 'b01001002': 50.0, 'b01001002_moe': 5.0}
+        self.assertEqual(value_rpn_calc(data, 'b01001002 b01001001 / %'), (None, None, None, None))
+
+    def test_missing_rows(self):
+        results = compile_rpn('b01001001').evaluate_many({}, ['01000US'])
+        self.assertEqual(results, [rpn.EMPTY_RESULT])
+
+    def test_compiled_once(self):
+        self.assertIs(compile_rpn('b01001001 100 /'), compile_rpn('b01001001 100 /'))
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, compile_rpn, 'b01001001 /')
+        self.assertRaises(ValueError, compile_rpn, '')
+
+
+@unittest.skipIf(rpn.numpy is None, "numpy isn't installed")
+class VectorizedParityTest(unittest.TestCase):
+    "evaluate_vectorized has to give exactly what build_item's scalar path does."
+
+    def random_data(self, expression, geoids):
+        data = {}
+        for geoid in geoids:
+            if self.random.random() < 0.1:
+                continue
+            row = {}
+            for column in expression.columns:
+                value = self.random.choice([None, 0.0, float(self.random.randint(0, 1000)), self.random.uniform(0, 1e5)])
+                row[column] = value
+                row[column + '_moe'] = None if value is None else self.random.choice(
+                    [float(self.random.randint(0, 100)), self.random.uniform(0, 100)])
+            data[geoid] = row
+        return data
+
+    def setUp(self):
+        self.random = random.Random(1)
+
+    def test_parity(self):
+        geoids = ['16000US1714000', '05000US17031', '04000US17', '01000US', '31000US16980']
+        for rpn_string in EXPRESSIONS:
+            expression = compile_rpn(rpn_string)
+            for trial in range(200):
+                data = self.random_data(expression, geoids)
+                scalar = [round_result(*result) for result in expression.evaluate_many(data, geoids)]
+                self.assertEqual(expression.evaluate_vectorized(data, geoids), scalar, rpn_string)
+
+    def test_packed_once_for_many_expressions(self):
+        geoids = ['04000US17', '01000US']
+        data = {}
+        for geoid in geoids:
+            data[geoid] = dict((column, 10.0) for expression in EXPRESSIONS for column in compile_rpn(expression).columns)
+            data[geoid].update((column + '_moe', 1.0) for column in data[geoid].keys())
+
+        columns = rpn.ColumnArrays(data, geoids)
+        self.assertEqual(columns['04000US17'], data['04000US17'])
+        for rpn_string in EXPRESSIONS:
+            expression = compile_rpn(rpn_string)
+            scalar = [round_result(*result) for result in expression.evaluate_many(data, geoids)]
+            self.assertEqual(expression.evaluate_vectorized(columns, geoids), scalar)
+        self.assertIs(columns.column('b01001001'), columns.column('b01001001'))
+
+
+if __name__ == '__main__':
+    unittest.main()
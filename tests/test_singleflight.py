@@ -0,0 +1,126 @@
+import threading
+import time
+import unittest
+
+from census_extractomatic.singleflight import SingleFlight
+
+
+class WatchedSingleFlight(SingleFlight):
+    "Counts the callers that have started waiting on each key."
+
+    def __init__(self, timeout=None):
+        super(WatchedSingleFlight, self).__init__(timeout)
+        self.waiting = {}
+        self.waiting_changed = threading.Condition()
+
+    def _waiting(self, key):
+        with self.waiting_changed:
+            self.waiting[key] = self.waiting.get(key, 0) + 1
+            self.waiting_changed.notify_all()
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flight = WatchedSingleFlight()
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def slow(self, result):
+        def fn():
+            self.calls.append(result)
+            self.started.set()
+            self.release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return fn
+
+    def run_followers(self, key, n):
+        "Start `n` callers for `key` once the leader is running; returns their threads and outcomes."
+        outcomes = []
+
+        def follow():
+            try:
+                outcomes.append(self.flight.do(key, self.slow('follower')))
+            except Exception, e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=follow) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        return (threads, outcomes)
+
+    def lead(self, key, fn):
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(self.flight.do(key, fn))
+            except Exception, e:
+                outcome.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(self.started.wait(5))
+        return (thread, outcome)
+
+    def wait_for_followers(self, key, n):
+        "Wait until `n` followers have started waiting on the leader's call."
+        deadline = time.time() + 5
+        with self.flight.waiting_changed:
+            while self.flight.waiting.get(key, 0) < n and time.time() < deadline:
+                self.flight.waiting_changed.wait(deadline - time.time())
+            if self.flight.waiting.get(key, 0) < n:
+                self.fail("Followers never started waiting")
+
+    def test_followers_share_the_leaders_result(self):
+        (leader, outcome) = self.lead('key', self.slow('leader'))
+        (threads, outcomes) = self.run_followers('key', 3)
+        self.wait_for_followers('key', 3)
+        self.release.set()
+
+        for thread in [leader] + threads:
+            thread.join(5)
+        self.assertEqual(self.calls, ['leader'])
+        self.assertEqual(outcome, ['leader'])
+        self.assertEqual(outcomes, ['leader'] * 3)
+
+    def test_followers_get_the_leaders_exception(self):
+        error = ValueError("render failed")
+        (leader, outcome) = self.lead('key', self.slow(error))
+        (threads, outcomes) = self.run_followers('key', 2)
+        self.wait_for_followers('key', 2)
+        self.release.set()
+
+        for thread in [leader] + threads:
+            thread.join(5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertIs(outcome[0], error)
+        self.assertEqual(outcomes, [error, error])
+
+    def test_followers_run_it_themselves_after_timeout(self):
+        self.flight = WatchedSingleFlight(timeout=0.05)
+        (leader, outcome) = self.lead('key', self.slow('leader'))
+        self.assertEqual(self.flight.do('key', lambda: 'follower'), 'follower')
+        self.assertEqual(self.flight.waiting, {'key': 1})
+
+        self.release.set()
+        leader.join(5)
+        self.assertEqual(outcome, ['leader'])
+
+    def test_later_calls_run_again(self):
+        self.assertEqual(self.flight.do('key', lambda: 1), 1)
+        self.assertEqual(self.flight.do('key', lambda: 2), 2)
+        self.assertEqual(self.flight._calls, {})
+
+    def test_different_keys_dont_wait(self):
+        (leader, outcome) = self.lead('one', self.slow('one'))
+        self.assertEqual(self.flight.do('two', lambda: 'two'), 'two')
+        self.release.set()
+        leader.join(5)
+        self.assertEqual(outcome, ['one'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from flask import Flask, g
+from sqlalchemy import create_engine
+
+from census_extractomatic.timing import RequestTimings, current_timings, timed, track_queries
+
+
+class RequestTimingsTest(unittest.TestCase):
+    def test_queries(self):
+        timings = RequestTimings()
+        timings.add_query('SELECT 1', 0.25)
+        timings.add_query('SELECT 2', 0.5)
+        timings.add_query('SELECT 3', 0.125)
+        self.assertEqual(timings.queries, 3)
+        self.assertEqual(timings.db, 0.875)
+        self.assertEqual(timings.slowest, (0.5, 'SELECT 2'))
+
+    def test_server_timing(self):
+        timings = RequestTimings()
+        timings.add_query('SELECT 1', 0.0125)
+        timings.add('json', 0.002)
+        timings.add('cache', 0.001)
+        timings.add('cache', 0.001)
+        header = timings.server_timing()
+        self.assertTrue(header.startswith('db;desc="1 queries";dur=12.5, cache;dur=2.0, json;dur=2.0, total;dur='))
+
+
+class TimedTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_outside_a_request(self):
+        self.assertIsNone(current_timings())
+        with timed('json'):
+            pass
+
+    def test_spans(self):
+        with self.app.app_context():
+            g.timings = RequestTimings()
+            with timed('json'):
+                pass
+            with timed('json'):
+                pass
+            self.assertIn('json', g.timings.spans)
+
+    def test_track_queries(self):
+        engine = create_engine('sqlite://')
+        track_queries(type(engine))
+        track_queries(type(engine))
+        with self.app.app_context():
+            g.timings = RequestTimings()
+            engine.execute('SELECT 1').fetchall()
+            engine.execute('SELECT 2').fetchall()
+            self.assertEqual(g.timings.queries, 2)
+            self.assertIn(g.timings.slowest[1], ('SELECT 1', 'SELECT 2'))
+
+
+if __name__ == '__main__':
+    unittest.main()